@@ -5,134 +5,394 @@ Runs the main game-loop.
 '''
 
 # Imports
-import os
-import platform
-import sys
-import abc
-import numpy as np
 import time
-import datetime
-import configparser
-import pygame
+
+# Start of the start up, before the heavy imports
+STARTED = time.perf_counter()
+
+import os
+import threading
 import io
-from io import BytesIO
-from pathlib import Path
-from plugins.clock import ClockPlugin
-from plugins.temperature import TemperaturePlugin
-import paho.mqtt.client as mqtt
+import numpy as np
+from scheduler import create_scheduler
+from stats import FrameStats, StartupTimer
+from commands import CommandQueue
+from pipeline import FrameRing
+from settings import Settings
+from transition import Transition
+
+# Optional components (display backends, plugins, MQTT) are imported when enabled
 
 # Global variables
 DISPLAY_WIDTH = 12
 DISPLAY_HEIGHT = 12
+PLUGINS = 'clock, temperature'
 
 
 class WordClock:
-    def __init__(self):
+    def __init__(self, startup=None):
+        if startup is None:
+            startup = StartupTimer()
+        self.startup = startup
+
         # Change working directory
         os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
-        if is_raspberrypi():
-            from display.ws2812b import WS2812B
+        # Settings shared by the display and plugins, parsed once
+        config = Settings('settings.conf')
+        self.settings = config
+        startup.mark('settings')
 
-            self.display = WS2812B(DISPLAY_WIDTH, DISPLAY_HEIGHT)
-        else:
-            from display.computer import Computer
+        # Size of the frames, which may span several panels
+        self.width = config.getint('display', 'width', fallback=DISPLAY_WIDTH)
+        self.height = config.getint('display', 'height', fallback=DISPLAY_HEIGHT)
 
-            self.display = Computer(DISPLAY_WIDTH, DISPLAY_HEIGHT, 5, 50)
-        
-        config = configparser.ConfigParser()
-        config.read('settings.conf')
-        self.enable_temperature = config.getboolean('temperature', 'enable')
-        if self.enable_temperature:
-            self.temperature_duration = config.getint('temperature', 'duration')
-            self.temperature_repeat = config.getint('temperature', 'repeat')
-        
-        # Sources
-        self.clock = ClockPlugin(DISPLAY_WIDTH, DISPLAY_HEIGHT)
+        self.display = create_display(
+            os.environ.get('WORDCLOCK_DISPLAY')
+            or config.get('display', 'backend', fallback='auto'),
+            self.width,
+            self.height,
+            config,
+        )
+        startup.mark('display')
         
-        if self.enable_temperature:
-            self.temperature = TemperaturePlugin(DISPLAY_WIDTH, DISPLAY_HEIGHT)
+        # Sources, shown in turn by the scheduler
+        self.plugins = []
+        for name in config.get('scheduler', 'plugins', fallback=PLUGINS).split(','):
+            name = name.strip()
+            if config.getboolean(name, 'enable', fallback=True):
+                self.plugins.append(create_plugin(name, self.width, self.height, config))
+                startup.mark(name)
         
-        self.source = self.clock
+        self.scheduler = create_scheduler(self.plugins, config, time.monotonic())
+        self.source = None
         
+        # Set to wake the main loop up before its next deadline
+        self.wakeup = threading.Event()
+
+        # Remote control, MQTT messages are queued and applied at frame boundaries
+        self.commands = CommandQueue(self.wakeup)
+        self.mqtt_host = None
+        if config.getboolean('mqtt', 'enable', fallback=True):
+            self.mqtt_host = config.get('mqtt', 'host', fallback='localhost')
+            self.mqtt_port = config.getint('mqtt', 'port', fallback=1883)
+
+        # Blend frames when switching between sources
+        self.transition = None
+        effect = config.get('transition', 'effect', fallback='cut')
+        if effect != 'cut':
+            self.transition = Transition(
+                self.width,
+                self.height,
+                effect,
+                config.getfloat('transition', 'duration', fallback=1.0),
+                config.getint('transition', 'fps', fallback=30),
+            )
+
+        # MQTT client, None until started
+        self.mqtt = None
+
+        # Frame timings
+        self.stats = None
+        if config.getboolean('stats', 'enable', fallback=True):
+            self.stats = FrameStats(
+                config.get('stats', 'file', fallback='stats.json'),
+                config.getint('stats', 'interval', fallback=60),
+                config.getfloat('stats', 'late_threshold', fallback=0.05),
+            )
+            self.stats.startup = startup
+
+        # Render frames ahead in a thread, and show them from this one at their deadline
+        self.pipeline = None
+        self.lead = config.getfloat('pipeline', 'lead', fallback=0.05)
+        if config.getboolean('pipeline', 'enable', fallback=False):
+            self.pipeline = FrameRing(
+                config.getint('pipeline', 'frames', fallback=4),
+                self.display.number_of_pixels,
+            )
 
     # The callback for when the client receives a CONNACK response from the server.
     def on_mqtt_connect(self, client, userdata, flags, rc):
         print('Connected with result code ' + str(rc))
 
-        # Subscribe to topics from the display
+        # Subscribe to topics from the display and plugins
         for topic in self.display.topics:
             client.subscribe(topic)
 
-        # Subscribe to topics from plugins
-        for topic in self.clock.topics:
-            client.subscribe(topic)
-        
-        for topic in self.temperature.topics:
-            client.subscribe(topic)
+        for plugin in self.plugins:
+            for topic in plugin.topics:
+                client.subscribe(topic)
 
-        # Add callback for the display
-        client.message_callback_add(
-            self.display.subscription_filter, self.display.callback
-        )
+    def start_mqtt(self, host, port):
+        '''Connect to the broker in the background, messages are queued for the main loop.'''
+        # Messages are applied by the main loop, never from the network thread
+        self.commands.subscribe(self.display.subscription_filter, self.display.callback)
+        for plugin in self.plugins:
+            self.commands.subscribe(plugin.subscription_filter, plugin.callback)
 
-        # Add callback for plugins using filter
-        client.message_callback_add(
-            self.source.subscription_filter, self.source.callback
-        )
+        import paho.mqtt.client as mqtt
+
+        client = mqtt.Client()
+        client.on_connect = self.on_mqtt_connect
+        client.on_message = self.commands.put
+        client.connect_async(host, port)
+        client.loop_start()
+        self.mqtt = client
+
+    def show_first_frame(self):
+        '''Light the clock up before the optional subsystems are started.'''
+        self.source, _ = self.scheduler.select(time.monotonic())
+        self.source.update(0)
+        self.display.buffer = self.source.buffer
+        self.display.show()
+        self.source.dirty = False
+        self.display.dirty = False
+        self.startup.mark('first frame')
+
+    def render(self, t, previous):
+        '''Run the sources for time t, and get the frame to show, None if it did not change.
+
+        previous is the last frame shown, the start of a transition.
+        '''
+        stats = self.stats
+
+        # Apply remote commands between two frames
+        self.commands.apply(self.mqtt)
+        if stats is not None:
+            stats.mark('commands')
+
+        # Switch to the plugin picked by the scheduler, which prepared its first frame
+        self.source, switched = self.scheduler.select(t)
+        if switched:
+            self.source.dirty = True
+
+        # Elapsed time in milliseconds
+        dt = (t - self._last) * 1000
+        self._last = t
 
-    # The callback for when a PUBLISH message is received from the server.
-    def on_mqtt_message(self, client, userdata, msg):
-        print(msg.topic + ' ' + str(msg.payload))
+        self.source.update(dt)
+        if stats is not None:
+            stats.mark('update')
+
+        transition = self.transition
+        if transition is not None:
+            if switched:
+                transition.start(previous, self.source.buffer, t)
+            elif transition.active and self.source.dirty:
+                transition.retarget(self.source.buffer)
+
+        if not (
+            self.source.dirty
+            or self.display.dirty
+            or (transition is not None and transition.active)
+        ):
+            return None
+
+        self.source.dirty = False
+        self.display.dirty = False
+        if transition is not None and transition.active:
+            return transition.render(t)
+        return self.source.buffer
+
+    def next_frame(self, t, lead=0.0):
+        '''Time of the next visible change, source switch or stats report after a frame rendered for t.
+
+        Frames are rendered lead seconds before their time, so the frame following
+        a stats report is the one rendered when the report is due. It is never
+        earlier than t.
+        '''
+        timeouts = [self.source.next_update(), self.scheduler.next_update(t)]
+        if self.transition is not None:
+            timeouts.append(self.transition.next_update())
+        timeouts = [timeout for timeout in timeouts if timeout is not None]
+
+        following = t + min(timeouts) if timeouts else None
+        if self.stats is not None:
+            report = self.stats.report_time() + lead
+            following = report if following is None else min(following, report)
+
+        if following is None:
+            return t
+        return max(following, t)
 
     def mainloop(self):
-        # Prepare and start loading resources
+        self.show_first_frame()
 
-        # MQTT (disabled)
-        # client = mqtt.Client()
-        # client.on_connect = self.on_mqtt_connect
-        # client.on_message = self.on_mqtt_message
-        # client.connect('localhost')
-        # client.loop_start()
+        # MQTT
+        if self.mqtt_host is not None:
+            self.start_mqtt(self.mqtt_host, self.mqtt_port)
+            self.startup.mark('mqtt')
 
-        # Timer
-        clock = pygame.time.Clock()
-        
-        start = 0
-        end = time.time()
-        src = 'c'
+        self.startup.report()
+
+        self._last = time.monotonic()
+        if self.pipeline is not None:
+            self.output()
+        else:
+            self.run()
+
+    def run(self):
+        '''Render and show every frame from this thread.'''
+        stats = self.stats
 
         while True:
-            if self.enable_temperature:
-                t = time.time()
-            
-                if t - end > self.temperature_repeat and src == 'c':
-                    start = t
-                    self.source = self.temperature
-                    src = 't'
-                
-                if t - start > self.temperature_duration and src == 't':
-                    end = t
-                    self.source = self.clock
-                    src = 'c'
-            
-            # Limit CPU usage do not go faster than FPS
-            dt = clock.tick(self.source.fps)
-
-            self.source.update(dt)
-            
-            # Update the display buffer
-            self.display.buffer = self.source.buffer
-
-            # Render the frame
+            t = time.monotonic()
+            if stats is not None:
+                stats.begin()
+
+            frame = self.render(t, self.display.buffer)
+            if frame is not None:
+                self.display.buffer = frame
+                if stats is not None:
+                    stats.mark('handoff')
+
+                # Render the frame
+                self.display.show()
+                if stats is not None:
+                    stats.mark('show')
+
+            else:
+                self.display.poll()
+                if stats is not None:
+                    stats.mark('poll')
+
+            if stats is not None:
+                stats.end(frame is not None)
+                stats.report(self.mqtt)
+
+            # Sleep until the next visible change, a source switch or an external event
+            deadline = self.next_frame(t)
+            if self.display.poll_interval is not None:
+                deadline = min(deadline, t + self.display.poll_interval)
+
+            woken = self.wakeup.wait(max(deadline - time.monotonic(), 0))
+            self.wakeup.clear()
+            if stats is not None and not woken:
+                stats.woke(time.monotonic() - deadline)
+
+    def produce(self):
+        '''Render frames lead seconds ahead of their deadline into the frame ring.'''
+        ring = self.pipeline
+        stats = self.stats
+        previous = np.zeros((self.display.number_of_pixels, 3), dtype=np.uint8)
+        np.copyto(previous, self.display.buffer)
+
+        deadline = time.monotonic() + self.lead
+        while True:
+            # Sleep until the frame is due for rendering, an external event brings it forward
+            if self.wakeup.wait(max(deadline - self.lead - time.monotonic(), 0)):
+                deadline = min(deadline, time.monotonic() + self.lead)
+            self.wakeup.clear()
+
+            # Report before the following frame is scheduled from the next report time
+            if stats is not None:
+                stats.report(self.mqtt)
+
+            # Plugins render the frame for its deadline
+            ahead = max(deadline - time.monotonic(), 0)
+            for plugin in self.plugins:
+                plugin.ahead = ahead
+
+            if stats is not None:
+                stats.begin()
+
+            frame = self.render(deadline, previous)
+            following = self.next_frame(deadline, self.lead)
+            if frame is not None:
+                slot = ring.acquire()
+                np.copyto(ring.frames[slot], frame)
+                np.copyto(previous, frame)
+                ring.commit(deadline, following)
+                if stats is not None:
+                    stats.mark('handoff')
+                    stats.end(False)
+
+            deadline = following
+
+    def output(self):
+        '''Show the frames of the render thread at their deadline, dropping the expired ones.'''
+        ring = self.pipeline
+        stats = self.stats
+
+        threading.Thread(target=self.produce, daemon=True).start()
+
+        while True:
+            slot = ring.get(self.display.poll_interval)
+            if slot is None:
+                self.display.poll()
+                continue
+
+            delay = ring.deadlines[slot] - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            # A frame whose successor is already due is dropped, unless it is the only one
+            now = time.monotonic()
+            if now >= ring.expiries[slot] and len(ring) > 1:
+                ring.release()
+                if stats is not None:
+                    stats.dropped += 1
+                continue
+
+            # The slot may be refilled by the render thread once released
+            deadline = ring.deadlines[slot]
+            start = time.perf_counter_ns()
+            self.display.buffer = ring.frames[slot]
             self.display.show()
+            ring.release()
 
-        return
+            if stats is not None:
+                stats.add('show', time.perf_counter_ns() - start)
+                stats.shown += 1
+                stats.woke(now - deadline)
 
 
 # Function declarations
 
 
+def create_display(backend='auto', width=DISPLAY_WIDTH, height=DISPLAY_HEIGHT, config=None):
+    '''Create the display backend: ws2812b, computer, memory, multi (several panels), or auto to pick from the platform.'''
+    if backend == 'auto':
+        backend = 'ws2812b' if is_raspberrypi() else 'computer'
+
+    if backend == 'ws2812b':
+        from display.ws2812b import WS2812B
+
+        return WS2812B(width, height, config=config)
+    if backend == 'computer':
+        from display.computer import Computer
+
+        return Computer(width, height, 5, 50, config=config)
+    if backend == 'memory':
+        from display.memory import Memory
+
+        return Memory(width, height, config=config)
+    if backend == 'multi':
+        from display.multi import Multi
+
+        return Multi(width, height, config=config, factory=create_display)
+
+    raise ValueError('Unknown display backend {}'.format(backend))
+
+
+def create_plugin(name, width=DISPLAY_WIDTH, height=DISPLAY_HEIGHT, config=None):
+    '''Create a plugin from its name: clock, temperature or ticker.'''
+    if name == 'clock':
+        from plugins.clock import ClockPlugin
+
+        return ClockPlugin(width, height, config)
+    if name == 'temperature':
+        from plugins.temperature import TemperaturePlugin
+
+        return TemperaturePlugin(width, height, config)
+    if name == 'ticker':
+        from plugins.ticker import TickerPlugin
+
+        return TickerPlugin(width, height, config)
+
+    raise ValueError('Unknown plugin {}'.format(name))
+
+
 def is_raspberrypi():
     try:
         with io.open('/sys/firmware/devicetree/base/model', 'r') as m:
@@ -145,7 +405,8 @@ def is_raspberrypi():
 
 # Main body
 if __name__ == '__main__':
-    wordclock = WordClock()
-    wordclock.display.show()
+    startup = StartupTimer(STARTED)
+    startup.mark('imports')
 
+    wordclock = WordClock(startup)
     wordclock.mainloop()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+'''
+Benchmark of the rendering pipeline.
+Times every stage of the plugins and display backends, for each layout and
+panel size, and reports percentiles as text or JSON.
+'''
+
+# Imports
+import os
+import sys
+import io
+import glob
+import json
+import time
+import argparse
+import platform
+import tempfile
+import numpy as np
+from layout import parse_size
+from settings import Settings
+
+# Global variables
+SIZES = '12x12,16x16,32x32'
+BACKENDS = 'memory,computer,ws2812b'
+ITERATIONS = 1000
+
+
+def load_config(layout, directory):
+    '''Settings for a benchmark run: simulated time and an offline weather provider.'''
+    config = Settings(None)
+    config.read(['settings.conf.example', 'settings.conf'])
+
+    config.set('clock', 'simulate', 'True')
+    config.set('display', 'layout', layout)
+    config.set('temperature', 'provider', 'file')
+    config.set('temperature', 'source', os.path.join(directory, 'weather.json'))
+    config.set('temperature', 'cache', os.path.join(directory, 'weather_cache.json'))
+    config.set('temperature', 'ttl', str(10 ** 9))
+
+    return config
+
+
+def measure(stage, iterations, warmup=10):
+    '''Call stage repeatedly and get statistics of its duration in microseconds.'''
+    for _ in range(warmup):
+        stage()
+
+    samples = np.empty(iterations, dtype=np.int64)
+    for i in range(iterations):
+        start = time.perf_counter_ns()
+        stage()
+        samples[i] = time.perf_counter_ns() - start
+
+    samples = samples / 1000
+    p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+
+    return {
+        'iterations': iterations,
+        'mean_us': float(samples.mean()),
+        'min_us': float(samples.min()),
+        'p50_us': float(p50),
+        'p90_us': float(p90),
+        'p99_us': float(p99),
+        'max_us': float(samples.max()),
+    }
+
+
+def clock_compile(plugin):
+    '''Prepare the color layers again and compose the frame, as done after a color change.'''
+    def stage():
+        plugin.rainbow = plugin.rainbow
+        plugin.update(0)
+
+    return stage
+
+
+def clock_update(plugin):
+    '''Select the frame of the next simulated time.'''
+    def stage():
+        plugin.update(1000 / plugin.fps)
+
+    return stage
+
+
+def temperature_update(plugin):
+    '''Render a new temperature every call.'''
+    temperatures = iter(range(10 ** 9))
+
+    def stage():
+        temp = next(temperatures) % 120 - 20
+        plugin._reading = (temp, plugin.location, time.time())
+        plugin.update(0)
+
+    return stage
+
+
+def ticker_update(plugin):
+    '''Scroll by one frame at 30 frames per second.'''
+    plugin.text = 'The quick brown fox jumps over the lazy dog'
+
+    def stage():
+        plugin.update(1000 / 30)
+
+    return stage
+
+
+def display_show(display, frames):
+    '''Hand a new frame to the display and show it.'''
+    count = iter(range(10 ** 9))
+
+    def stage():
+        display.buffer = frames[next(count) % len(frames)]
+        display.show()
+
+    return stage
+
+
+def sample_frames(plugin, count):
+    '''Copy the buffers of count successive updates of plugin.'''
+    frames = []
+    for _ in range(count):
+        plugin.update(1000 / plugin.fps)
+        frames.append(plugin.buffer.copy())
+
+    return frames
+
+
+def run(sizes, layouts, backends, iterations):
+    '''Run every benchmark case and get the list of results.'''
+    from app import create_display
+    from plugins.clock import ClockPlugin
+    from plugins.temperature import TemperaturePlugin
+    from plugins.ticker import TickerPlugin
+
+    results = []
+
+    def case(plugin, stage, size, layout=None, backend=None, build=None, repeat=iterations):
+        result = {
+            'plugin': plugin,
+            'stage': stage,
+            'size': '{}x{}'.format(*size),
+            'layout': layout,
+            'backend': backend,
+        }
+        try:
+            result.update(measure(build(), repeat))
+        except ImportError as e:
+            result['skipped'] = str(e)
+        except Exception as e:
+            result['error'] = '{}: {}'.format(type(e).__name__, e)
+
+        results.append(result)
+        print(format_result(result), file=sys.stderr)
+        return result
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            width, height = size
+
+            for layout in layouts:
+                config = load_config(layout, directory)
+
+                clock = {}
+
+                def build_clock():
+                    plugin = ClockPlugin(width, height, config)
+                    plugin.update(0)
+                    clock['plugin'] = plugin
+                    return clock_compile(plugin)
+
+                case('clock', 'compile', size, layout, build=build_clock, repeat=max(iterations // 100, 5))
+                if 'plugin' in clock:
+                    case('clock', 'update', size, layout, build=lambda: clock_update(clock['plugin']))
+
+                for backend in backends:
+                    def build_show():
+                        display = create_display(backend, width, height, config)
+                        if 'plugin' in clock:
+                            frames = sample_frames(clock['plugin'], 64)
+                        else:
+                            frames = np.random.randint(0, 256, (64, width * height, 3), dtype=np.uint8)
+                        return display_show(display, frames)
+
+                    case('display', 'show', size, layout, backend, build=build_show)
+
+            config = load_config(layouts[0], directory)
+            case(
+                'temperature',
+                'update',
+                size,
+                build=lambda: temperature_update(TemperaturePlugin(width, height, config)),
+            )
+            case(
+                'ticker',
+                'update',
+                size,
+                build=lambda: ticker_update(TickerPlugin(width, height, config)),
+            )
+
+    return results
+
+
+def format_result(result):
+    name = ' '.join(
+        str(result[key]) for key in ('plugin', 'stage', 'size', 'layout', 'backend')
+        if result[key] is not None
+    )
+    if 'skipped' in result:
+        return '{:<60} skipped ({})'.format(name, result['skipped'])
+    if 'error' in result:
+        return '{:<60} failed ({})'.format(name, result['error'])
+
+    return '{:<60} p50 {:>9.1f}us  p90 {:>9.1f}us  p99 {:>9.1f}us  max {:>9.1f}us'.format(
+        name, result['p50_us'], result['p90_us'], result['p99_us'], result['max_us']
+    )
+
+
+def machine():
+    '''Describe the machine the benchmark runs on.'''
+    model = platform.machine()
+    try:
+        with io.open('/sys/firmware/devicetree/base/model', 'r') as m:
+            model = m.read().strip('\x00\n')
+    except Exception:
+        pass
+
+    return {
+        'model': model,
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+    }
+
+
+# Main body
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser(description='Benchmark the word clock rendering pipeline.')
+    parser.add_argument('--sizes', default=SIZES, help='comma separated panel sizes (default: %(default)s)')
+    parser.add_argument('--layouts', default=None, help='comma separated layout files (default: all)')
+    parser.add_argument('--backends', default=BACKENDS, help='comma separated display backends (default: %(default)s)')
+    parser.add_argument('--iterations', type=int, default=ITERATIONS, help='calls per stage (default: %(default)s)')
+    parser.add_argument('--json', metavar='FILE', help='write results as JSON to FILE, - for stdout')
+    args = parser.parse_args()
+
+    # Do not open windows, the simulator still renders every frame
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+    layouts = args.layouts.split(',') if args.layouts else sorted(glob.glob('layouts/*.json'))
+    results = run(
+        [parse_size(size) for size in args.sizes.split(',')],
+        layouts,
+        args.backends.split(','),
+        args.iterations,
+    )
+
+    if args.json:
+        report = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'machine': machine(),
+            'results': results,
+        }
+        if args.json == '-':
+            json.dump(report, sys.stdout, indent=2)
+        else:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=2)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+import threading
+from collections import OrderedDict
+
+
+class CommandQueue:
+    '''Thread-safe queue of MQTT messages, applied by the main loop at frame boundaries.
+
+    Only the latest message of each topic is kept, so a burst of updates to the
+    same topic (e.g. a color slider) is applied once.
+    '''
+    def __init__(self, wakeup=None):
+        self.wakeup = wakeup
+        self.received = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._messages = OrderedDict()
+        self._handlers = []
+
+    def subscribe(self, subscription_filter, callback):
+        '''Call callback(client, userdata, msg) for the messages matching subscription_filter.'''
+        self._handlers.append((subscription_filter, callback))
+
+    def put(self, client, userdata, msg):
+        '''Queue a message, replacing a pending message of the same topic. Usable as paho on_message.'''
+        with self._lock:
+            self.received += 1
+            if self._messages.pop(msg.topic, None) is not None:
+                self.coalesced += 1
+            self._messages[msg.topic] = msg
+
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def apply(self, client=None):
+        '''Dispatch the pending messages to their handlers, from the calling thread.'''
+        if not self._messages:
+            return 0
+
+        from paho.mqtt.client import topic_matches_sub
+
+        with self._lock:
+            messages, self._messages = self._messages, OrderedDict()
+
+        for msg in messages.values():
+            for subscription_filter, callback in self._handlers:
+                if topic_matches_sub(subscription_filter, msg.topic):
+                    try:
+                        callback(client, None, msg)
+                    except Exception as e:
+                        print('Error while handling {}: {}'.format(msg.topic, e))
+
+        return len(messages)
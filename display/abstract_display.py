@@ -2,22 +2,53 @@
 
 import abc
 import numpy as np
-import time
-import configparser
+from geometry import get_geometry
+from settings import Settings
 
 
 class AbstractDisplay(abc.ABC):
-    def __init__(self, width=16, height=16):
+    # Seconds between two polls of the backend events, None if not needed
+    poll_interval = None
+
+    def __init__(self, width=12, height=12, config=None):
         self.width = width
         self.height = height
         self.number_of_pixels = self.height * self.width
         
-        self.config = configparser.ConfigParser()
-        self.config.read('settings.conf')
+        if config is None:
+            config = Settings('settings.conf')
+        self.config = config
         self.section = 'display'
         
         self._buffer = np.zeros((self.number_of_pixels, 3), dtype=np.uint8)
         self._brightness = self.config.getfloat(self.section, 'brightness')
+        self._gamma = self.config.getfloat(self.section, 'gamma', fallback=1.0)
+        self._white_balance = tuple(
+            float(value)
+            for value in self.config.get(self.section, 'white_balance', fallback='1.0, 1.0, 1.0').split(',')
+        )
+
+        # Set when the same buffer should be shown again, e.g. after a brightness change
+        self.dirty = False
+
+        # Buffers use the layout (default) wiring, the LEDs may be wired differently
+        self.layout_geometry = get_geometry(self.width, self.height)
+        self.geometry = get_geometry(
+            self.width,
+            self.height,
+            self.config.get(self.section, 'start', fallback='bottom-right'),
+            self.config.get(self.section, 'order', fallback='rows'),
+            self.config.getboolean(self.section, 'serpentine', fallback=True),
+        )
+        self._wiring = self.geometry.remap_from(self.layout_geometry)
+
+        # Color correction table of the three channels, flattened, and output scratch buffers
+        self._lut = None
+        self._channels = np.arange(3, dtype=np.uint16) * 256
+        self._indexes = np.zeros((self.number_of_pixels, 3), dtype=np.uint16)
+        self._wired_indexes = np.zeros((self.number_of_pixels, 3), dtype=np.uint16)
+        self._output = np.zeros((self.number_of_pixels, 3), dtype=np.uint8)
+        self.__build_lut()
 
     @property
     def buffer(self):
@@ -30,14 +61,36 @@ class AbstractDisplay(abc.ABC):
             if self._buffer.shape == value.shape:
                 self._buffer = value
 
+    def output_buffer(self):
+        '''The buffer reordered to the wiring of the LEDs, with gamma, white balance and brightness applied.'''
+        np.add(self._buffer, self._channels, out=self._indexes)
+        indexes = self._indexes
+        if self._wiring is not None:
+            np.take(self._indexes, self._wiring, axis=0, out=self._wired_indexes)
+            indexes = self._wired_indexes
+        
+        np.take(self._lut, indexes, out=self._output)
+        return self._output
+
+    def __build_lut(self):
+        '''Precompute the output value of every channel value.'''
+        values = (np.arange(256) / 255) ** self._gamma * self._brightness * 255
+        lut = np.outer(self._white_balance, values)
+        self._lut = np.clip(np.rint(lut), 0, 255).astype(np.uint8).ravel()
+        self.lut_version = getattr(self, 'lut_version', 0) + 1
+        self.dirty = True
+
     def clear_buffer(self):
         '''Erase the buffer and fill it with zeros.'''
         self._buffer = np.zeros_like(self._buffer)
 
     @abc.abstractmethod
-    def show(self, gamma=False):
+    def show(self):
         '''Display the content of the buffer.'''
 
+    def poll(self):
+        '''Process pending backend events when no new frame is shown.'''
+
     @property
     def topics(self):
         '''Get an array of of topics which the display driver accepts'''
@@ -54,8 +107,8 @@ class AbstractDisplay(abc.ABC):
             if msg.topic == 'wordclock/display/brightness':
                 txt = msg.payload.decode('utf-8')
                 b = float(txt)
-                self._brightness = b
-                self.config.set(self.section, 'brightness', txt)
+                self.brightness = b
+                self.config.set(self.section, 'brightness', str(self.brightness))
         except ValueError as ve:
             print('Invalid brightness value')
 
@@ -72,6 +125,27 @@ class AbstractDisplay(abc.ABC):
             self._brightness = 0
         else:
             self._brightness = value
+        self.__build_lut()
+
+    @property
+    def gamma(self):
+        '''Exponent applied to channel values, 1.0 to disable.'''
+        return self._gamma
+
+    @gamma.setter
+    def gamma(self, value):
+        self._gamma = value
+        self.__build_lut()
+
+    @property
+    def white_balance(self):
+        '''Scale of the red, green and blue channels (0.0 to 1.0).'''
+        return self._white_balance
+
+    @white_balance.setter
+    def white_balance(self, value):
+        self._white_balance = tuple(value)
+        self.__build_lut()
 
     def set_pixel_at_index(self, index, color):
         if (index < 0) or (index > self.number_of_pixels):
@@ -82,7 +156,7 @@ class AbstractDisplay(abc.ABC):
     def set_pixel_at_coord(self, x, y, color):
         if (x < 0) or (x >= self.width) or (y < 0) or (y >= self.height):
             return
-        self._buffer[y, x] = color
+        self._buffer[self.layout_geometry.index_map[y, x]] = color
 
     def set_buffer_with_flat_values(self, rgb_values):
         rgb_values = np.array(rgb_values, dtype=np.uint8)
@@ -107,21 +181,3 @@ class AbstractDisplay(abc.ABC):
             return (0, 255 - pos * 3, pos * 3)
         pos -= 170
         return (pos * 3, 0, 255 - pos * 3)
-
-    def run_benchmark(self):
-        total = 0
-        repeat = self.number_of_pixels * 10
-        for i in range(repeat):
-            start = time.time()
-            self.set_pixel_at_index(i % self.number_of_pixels, (255, 255, 255))
-            self.clear_buffer()
-            end = time.time()
-            diff = end - start
-            total = total + diff
-        print(
-            '{:.2f}s for {} iterations. {:d} refreshs per second'.format(
-                total, repeat, int(repeat / total)
-            )
-        )
-        self.clear_buffer()
-        self.show()
@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
-import configparser
 import sys
 import pygame
 import random
-import json
+import numpy as np
+from collections import OrderedDict
 
 from display.abstract_display import AbstractDisplay
+from layout import load_layout
 from array import *
 
 # Colors
@@ -17,10 +18,17 @@ GRAY = (100, 100, 100)
 DARKGRAY = (20, 20, 20)
 WHITE = (255, 255, 255)
 
+# Rendered surfaces kept in cache
+GLYPH_CACHE_SIZE = 4096
+INDEX_CACHE_SIZE = 1024
+
 
 class Computer(AbstractDisplay):
-    def __init__(self, width=12, height=12, margin=5, size=50):
-        super().__init__(width, height)
+    # Keep the window responsive while the clock sleeps
+    poll_interval = 0.1
+
+    def __init__(self, width=12, height=12, margin=5, size=50, config=None):
+        super().__init__(width, height, config)
 
         self.margin = margin
         self.size = size
@@ -33,39 +41,18 @@ class Computer(AbstractDisplay):
         pygame.init()
         pygame.font.init()
 
-        self.config = configparser.ConfigParser()
-        self.config.read('settings.conf')
-        self.section = 'computer'
+        self.backend_section = 'computer'
 
-        self.fill_empty = self.config.getboolean(self.section, 'fill_empty')
-        self.show_index = self.config.getboolean(self.section, 'show_index')
+        self.fill_empty = self.config.getboolean(self.backend_section, 'fill_empty')
+        self.show_index = self.config.getboolean(self.backend_section, 'show_index')
 
         # Load fonts
         self.index_font = pygame.font.SysFont('arial', 12)
         self.char_font = pygame.font.Font('fonts/D-DINExp-Bold.ttf', self.size)
 
-        # Prepare word list
-        self.words = ['' for _ in range(self.number_of_pixels)]
-
-        # Load layout
-        layout = self.config.get('display', 'layout')
-        f = open(layout, encoding='utf-8')
-        layout = json.load(f)
-
-        # Read layout words
-        for category in layout:
-            for words in layout[category]:
-                word = layout[category][words]['word']
-                index = int(layout[category][words]['index'])
-                
-                add = 1
-                if (index // self.width) % 2 == 0:
-                    index += len(word) - 1
-                    add = -1
-                
-                for char in word:
-                    self.words[index] = char
-                    index += add
+        # Characters of the compiled layout
+        layout = load_layout(self.config.get('display', 'layout'), width, height)
+        self.words = layout.chars.tolist()
         
         # Add random letters to empty slots
         if self.fill_empty:
@@ -74,76 +61,108 @@ class Computer(AbstractDisplay):
                     uppercase = 'ABCDEFGHIJKLMNOPQRSTUVXYZ'
                     self.words[i] = random.choice(uppercase)
 
+        # Screen area of every LED, glyph caches and last frame drawn
+        self.cells = [
+            pygame.Rect(
+                (self.margin + self.size) * int(self.layout_geometry.columns[index]) + self.margin,
+                (self.margin + self.size) * int(self.layout_geometry.rows[index]) + self.margin,
+                self.size,
+                self.size,
+            )
+            for index in range(self.number_of_pixels)
+        ]
+        self.glyphs = SurfaceCache(GLYPH_CACHE_SIZE)
+        self.index_labels = SurfaceCache(INDEX_CACHE_SIZE)
+        self._shown = None
+
         # Create the window
         self.surface = pygame.display.set_mode(self.window_size)
         pygame.display.set_caption('tidsram {}x{}'.format(width, height))
                 
         self.show()
 
-    def show(self):
+    def poll(self):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
+
+    def show(self):
+        self.poll()
         
-        for index in range(self.number_of_pixels):
-            row = (self.number_of_pixels - 1 - index) // self.width
-            if (row - self.height + 1) % 2 == 0:
-                column = (self.number_of_pixels - 1 - index) % self.width
-            else:
-                column = index % self.width
+        # Only redraw the cells whose color changed since the previous frame
+        buffer = self.buffer
+        if self._shown is None:
+            changed = range(self.number_of_pixels)
+            self._shown = buffer.copy()
+        else:
+            changed = np.flatnonzero(np.any(buffer != self._shown, axis=1))
+            self._shown[changed] = buffer[changed]
         
-            color = self.buffer[index]
-                            
+        rects = []
+        for index in changed:
+            rect = self.cells[index]
+            color = tuple(buffer[index])
+            
             # Draw background color and border
-            pygame.draw.rect(
-                self.surface,
-                BLACK,
-                [
-                    (self.margin + self.size) * column + self.margin,
-                    (self.margin + self.size) * row + self.margin,
-                    self.size,
-                    self.size,
-                ],
-            )
+            pygame.draw.rect(self.surface, BLACK, rect)
 
             # Draw characters from words array
-            character = self.char_font.render(
-                self.words[index], True, color
-            )
             self.surface.blit(
-                character,
-                [
-                    (self.margin + self.size) * column + self.margin * 3,
-                    (self.margin + self.size) * row + self.margin,
-                    self.size,
-                    self.size,
-                ],
+                self.__glyph(self.words[index], color),
+                (rect.x + self.margin * 2, rect.y),
             )
 
             # Draw index number of current character
             if self.show_index:
-                index_as_img = self.index_font.render(
-                    str(index), True, WHITE
-                )
-                self.surface.blit(
-                    index_as_img,
-                    [
-                        (self.margin + self.size) * column + self.margin,
-                        (self.margin + self.size) * row + self.margin,
-                        self.size,
-                        self.size,
-                    ],
-                )
-
-        pygame.display.update()
+                self.surface.blit(self.__index_label(index), rect)
+            
+            rects.append(rect)
+
+        if rects:
+            pygame.display.update(rects)
         
         return
 
+    def __glyph(self, char, color):
+        '''Get the rendered surface of a character, from the cache when possible.'''
+        key = (char, color)
+        surface = self.glyphs.get(key)
+        if surface is None:
+            surface = self.char_font.render(char, True, color)
+            self.glyphs.put(key, surface)
+        return surface
+
+    def __index_label(self, index):
+        '''Get the rendered surface of an LED index, from the cache when possible.'''
+        surface = self.index_labels.get(index)
+        if surface is None:
+            surface = self.index_font.render(str(index), True, WHITE)
+            self.index_labels.put(index, surface)
+        return surface
+
+
+class SurfaceCache:
+    '''Least recently used cache of rendered surfaces.'''
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._surfaces = OrderedDict()
+
+    def get(self, key):
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+        return surface
+
+    def put(self, key, surface):
+        self._surfaces[key] = surface
+        self._surfaces.move_to_end(key)
+        if len(self._surfaces) > self.capacity:
+            self._surfaces.popitem(last=False)
+
 
 if __name__ == '__main__':
     display = Computer()
-    # display.run_benchmark()
     display.create_test_pattern()
     display.show()
     import time
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+import time
+import numpy as np
+from display.abstract_display import AbstractDisplay
+
+
+class Memory(AbstractDisplay):
+    '''Headless display keeping frames in memory, for benchmarks and tests.'''
+    def __init__(self, width=12, height=12, history=None, config=None):
+        super().__init__(width, height, config)
+
+        self.backend_section = 'memory'
+        if history is None:
+            history = self.config.getint(self.backend_section, 'history', fallback=0)
+
+        # Ring of the last shown frames and their timestamps
+        self.history = history
+        self._frames = np.zeros((history, self.number_of_pixels, 3), dtype=np.uint8)
+        self._timestamps = np.zeros(history, dtype=np.float64)
+        self.show_count = 0
+        self.frame = np.zeros((self.number_of_pixels, 3), dtype=np.uint8)
+        self.timestamp = None
+
+    def show(self):
+        '''Copy the buffer, as sent to the LEDs, to the last frame and the history ring.'''
+        self.timestamp = time.perf_counter()
+        np.copyto(self.frame, self.output_buffer())
+
+        if self.history:
+            slot = self.show_count % self.history
+            self._frames[slot] = self.frame
+            self._timestamps[slot] = self.timestamp
+
+        self.show_count += 1
+        return
+
+    @property
+    def frames(self):
+        '''Frames kept in history, oldest first.'''
+        return self._frames[self.__order()]
+
+    @property
+    def timestamps(self):
+        '''perf_counter() time at which each frame of history was shown, oldest first.'''
+        return self._timestamps[self.__order()]
+
+    def __order(self):
+        count = min(self.show_count, self.history)
+        start = self.show_count - count
+        return np.arange(start, start + count) % max(self.history, 1)
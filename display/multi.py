@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import re
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from display.abstract_display import AbstractDisplay
+from geometry import get_geometry
+from settings import Settings
+
+ROTATIONS = (0, 90, 180, 270)
+
+# Panel of a chain: WIDTHxHEIGHT+X+Y, with an optional @ROTATION in degrees clockwise
+PANEL = re.compile(r'^(\d+)x(\d+)\+(\d+)\+(\d+)(?:@(\d+))?$')
+
+
+def parse_panel(text):
+    '''Parse a panel description to (width, height, x, y, rotation).'''
+    match = PANEL.match(text.strip())
+    if match is None:
+        raise ValueError('Invalid panel {}, expected WIDTHxHEIGHT+X+Y[@ROTATION]'.format(text))
+
+    width, height, x, y, rotation = (int(value) if value else 0 for value in match.groups())
+    if rotation not in ROTATIONS:
+        raise ValueError('Invalid panel rotation {}'.format(rotation))
+
+    return width, height, x, y, rotation
+
+
+def panel_map(frame_geometry, width, height, x, y, rotation, start='bottom-right', order='rows', serpentine=True):
+    '''Get the LED index of the frame shown by every LED of a panel, in the order of its strip.'''
+    panel = get_geometry(width, height, start, order, serpentine)
+    rows, columns = panel.rows, panel.columns
+
+    # Position in the area of the frame covered by the panel, turned clockwise
+    if rotation == 90:
+        rows, columns = columns, height - 1 - rows
+    elif rotation == 180:
+        rows, columns = height - 1 - rows, width - 1 - columns
+    elif rotation == 270:
+        rows, columns = width - 1 - columns, rows
+
+    rows = rows + y
+    columns = columns + x
+    if rows.max() >= frame_geometry.height or columns.max() >= frame_geometry.width:
+        raise ValueError('Panel {}x{}+{}+{}@{} is out of the {}x{} frame'.format(
+            width, height, x, y, rotation, frame_geometry.width, frame_geometry.height))
+
+    return frame_geometry.index_map[rows, columns]
+
+
+class Multi(AbstractDisplay):
+    '''Split the frame over several LED strips, each a chain of one or more panels.
+
+    Every output is a display of its own (ws2812b or memory) showing the LEDs of
+    its panels in strip order, gathered from the frame with a precomputed index
+    map. The outputs are shown in parallel.
+    '''
+    def __init__(self, width=12, height=12, config=None, factory=None):
+        super().__init__(width, height, config)
+
+        self.outputs = []
+        self._maps = []
+        self._buffers = []
+        for name in self.config.get(self.section, 'outputs').split(','):
+            name = name.strip()
+            backend = self.config.get(name, 'backend', fallback='ws2812b')
+            if backend not in ('ws2812b', 'memory'):
+                raise ValueError('Output {}: panels are driven by ws2812b or memory displays'.format(name))
+
+            # Panels of the chain, in strip order
+            wiring = (
+                self.config.get(name, 'start', fallback='bottom-right'),
+                self.config.get(name, 'order', fallback='rows'),
+                self.config.getboolean(name, 'serpentine', fallback=True),
+            )
+            index_map = np.concatenate([
+                panel_map(self.layout_geometry, *parse_panel(panel), *wiring)
+                for panel in self.config.get(name, 'panels').split(',')
+            ])
+            index_map.flags.writeable = False
+
+            # The output shows its buffer as is, color corrected with the display settings
+            output = factory(backend, len(index_map), 1, self.__output_config(name))
+            self.outputs.append(output)
+            self._maps.append(index_map)
+            self._buffers.append(np.zeros((len(index_map), 3), dtype=np.uint8))
+
+        self._executor = None
+        if len(self.outputs) > 1:
+            self._executor = ThreadPoolExecutor(len(self.outputs), thread_name_prefix='output')
+
+    def __output_config(self, name):
+        '''Settings of an output: the display settings, with its own pin and the strip wiring.'''
+        config = Settings(None)
+        config.read_dict(self.config)
+        for option in ('start', 'order', 'serpentine'):
+            config.remove_option(self.section, option)
+        if self.config.has_option(name, 'pin'):
+            if not config.has_section('ws2812b'):
+                config.add_section('ws2812b')
+            config.set('ws2812b', 'pin', self.config.get(name, 'pin'))
+
+        return config
+
+    def show(self):
+        '''Gather the LEDs of every output from the buffer and show the outputs.'''
+        for output, index_map, buffer in zip(self.outputs, self._maps, self._buffers):
+            np.take(self.buffer, index_map, axis=0, out=buffer)
+            output.buffer = buffer
+
+        if self._executor is None:
+            for output in self.outputs:
+                output.show()
+        else:
+            for future in [self._executor.submit(output.show) for output in self.outputs]:
+                future.result()
+
+    def poll(self):
+        for output in self.outputs:
+            output.poll()
+
+    def callback(self, client, userdata, msg):
+        super().callback(client, userdata, msg)
+        for output in self.outputs:
+            output.brightness = self.brightness
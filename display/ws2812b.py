@@ -3,7 +3,6 @@
 import numpy as np
 import sys
 from display.abstract_display import AbstractDisplay
-import configparser
 
 import board
 import neopixel
@@ -14,34 +13,56 @@ LED_ORDER       = neopixel.GRB  # neopixel.GRB if colors are revert
 
 
 class WS2812B(AbstractDisplay):
-    def __init__(self, width=16, height=16):
-        super().__init__(width, height)
-
-        self.config = configparser.ConfigParser()
-        self.config.read('settings.conf')
-        self.section = 'display'
-
-        self._brightness = self.config.getfloat(self.section, 'brightness')
+    def __init__(self, width=12, height=12, config=None):
+        super().__init__(width, height, config)
         
         # Create NeoPixel object with appropriate configuration.
+        # Brightness is applied with the color correction of whole frames.
+        pin = LED_PIN
+        if self.config.has_option('ws2812b', 'pin'):
+            pin = getattr(board, self.config.get('ws2812b', 'pin'))
         self.strip = neopixel.NeoPixel(
-            LED_PIN,
+            pin,
             self.number_of_pixels,
-            brightness = self._brightness,
+            brightness = 1.0,
             pixel_order = LED_ORDER,
             auto_write = False
         )
+        
+        # Write frames straight into the strip bytes when the pure python pixelbuf is used
+        self._pixels = None
+        raw = getattr(self.strip, '_post_brightness_buffer', None)
+        if raw is not None:
+            bpp = self.strip.bpp
+            self._pixels = np.frombuffer(
+                raw,
+                dtype=np.uint8,
+                count=self.number_of_pixels * bpp,
+                offset=self.strip._offset,
+            ).reshape(self.number_of_pixels, bpp)
+            self._byteorder = list(self.strip._byteorder[:3])
+        
+        self._last = np.empty((self.number_of_pixels, 3), dtype=np.uint8)
+        self._last_lut_version = None
                 
         # Intialize the library (must be called once before other functions).
         # self.strip.begin()
     
     def show(self):
-        '''Iterate through the buffer and assign each LED index a color from the buffer'''
-        for index in range(self.number_of_pixels):
-            color = self.buffer[index]
-            self.strip[index] = tuple(color)
+        '''Color correct the buffer and push it to the strip, unless it is already displayed'''
+        if self._last_lut_version == self.lut_version and np.array_equal(self.buffer, self._last):
+            return
+        
+        np.copyto(self._last, self.buffer)
+        self._last_lut_version = self.lut_version
+        output = self.output_buffer()
+        
+        if self._pixels is not None:
+            self._pixels[:, self._byteorder] = output
+        else:
+            for index in range(self.number_of_pixels):
+                self.strip[index] = tuple(output[index])
         
-        self.strip.brightness = self._brightness
         self.strip.show()
         return
 
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import functools
+import numpy as np
+
+STARTS = ('top-left', 'top-right', 'bottom-left', 'bottom-right')
+ORDERS = ('rows', 'columns')
+
+
+class Geometry:
+    '''Mapping between LED indexes along the strip and (row, column) coordinates of the panel.'''
+    def __init__(self, width, height, start='bottom-right', order='rows', serpentine=True):
+        if start not in STARTS:
+            raise ValueError('Invalid start corner {}'.format(start))
+        if order not in ORDERS:
+            raise ValueError('Invalid wiring order {}'.format(order))
+
+        self.width = width
+        self.height = height
+        self.number_of_pixels = width * height
+        self.start = start
+        self.order = order
+        self.serpentine = serpentine
+
+        top = start.startswith('top')
+        left = start.endswith('left')
+
+        index = np.arange(self.number_of_pixels)
+        if order == 'rows':
+            line, position = np.divmod(index, width)
+            reverse = np.logical_xor(not left, serpentine & (line % 2 == 1))
+            self.rows = line if top else height - 1 - line
+            self.columns = np.where(reverse, width - 1 - position, position)
+        else:
+            line, position = np.divmod(index, height)
+            reverse = np.logical_xor(not top, serpentine & (line % 2 == 1))
+            self.columns = line if left else width - 1 - line
+            self.rows = np.where(reverse, height - 1 - position, position)
+
+        # LED index of every (row, column)
+        self.index_map = np.empty((height, width), dtype=np.intp)
+        self.index_map[self.rows, self.columns] = index
+
+        for array in (self.rows, self.columns, self.index_map):
+            array.flags.writeable = False
+
+        self._remaps = {}
+
+    def to_grid(self, frame):
+        '''Reorder a frame of shape (..., number_of_pixels, 3) to (..., height, width, 3).'''
+        return frame[..., self.index_map, :]
+
+    def to_strip(self, grid):
+        '''Reorder a frame of shape (..., height, width, 3) to (..., number_of_pixels, 3).'''
+        return grid[..., self.rows, self.columns, :]
+
+    def remap_from(self, other):
+        '''Get the LED indexes of other matching each LED of this geometry, for frame[remap] gathers.'''
+        if other is self:
+            return None
+
+        if other not in self._remaps:
+            remap = other.index_map[self.rows, self.columns]
+            remap.flags.writeable = False
+            self._remaps[other] = remap
+
+        return self._remaps[other]
+
+
+@functools.lru_cache(maxsize=None)
+def get_geometry(width, height, start='bottom-right', order='rows', serpentine=True):
+    '''Get the shared geometry for a panel size and wiring.'''
+    return Geometry(width, height, start, order, serpentine)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+'''
+Bitmap fonts.
+A font file holds glyphs of any width drawn with # and ., loaded into one
+atlas bitmap. Text is rendered by copying glyph slices side by side, and
+blitted into frames with clipping.
+'''
+
+# Imports
+import functools
+import numpy as np
+
+# Name of the glyph of a space in font files
+SPACE = 'space'
+
+
+class FontError(ValueError):
+    '''Raised when a font file is malformed.'''
+
+
+class Atlas:
+    '''Glyphs of a font, stored side by side in one boolean bitmap.'''
+    def __init__(self, bitmap, glyphs):
+        # Rows of every glyph, of shape (height, total width)
+        self.bitmap = bitmap
+        self.bitmap.flags.writeable = False
+        self.height = bitmap.shape[0]
+
+        # First column and width of every glyph in the bitmap, by character
+        self.glyphs = glyphs
+
+    def __contains__(self, char):
+        return char in self.glyphs
+
+    def measure(self, text, spacing=1):
+        '''Get the width of text, characters missing from the font are skipped.'''
+        widths = [self.glyphs[char][1] for char in text if char in self.glyphs]
+        if not widths:
+            return 0
+        return sum(widths) + spacing * (len(widths) - 1)
+
+    def render(self, text, spacing=1, out=None):
+        '''Render text to a boolean bitmap of shape (height, width), characters missing from the font are skipped.'''
+        width = self.measure(text, spacing)
+        if out is None:
+            out = np.zeros((self.height, width), dtype=bool)
+        else:
+            out[:, :width] = False
+
+        x = 0
+        for char in text:
+            if char not in self.glyphs:
+                continue
+            start, glyph_width = self.glyphs[char]
+            out[:, x:x + glyph_width] = self.bitmap[:, start:start + glyph_width]
+            x += glyph_width + spacing
+
+        return out[:, :width]
+
+
+# Function declarations
+
+
+def parse(source):
+    '''Parse a font file to an Atlas, raises FontError when malformed.'''
+    glyphs = []
+    for number, line in enumerate(source.splitlines(), 1):
+        line = line.rstrip()
+        if not line or line.startswith(';'):
+            continue
+
+        if line.startswith(':'):
+            char = line[1:]
+            if char == SPACE:
+                char = ' '
+            if len(char) != 1:
+                raise FontError('line {}: a glyph is named by one character or :{}'.format(number, SPACE))
+            glyphs.append((char, []))
+        elif not glyphs:
+            raise FontError('line {}: rows before the first glyph'.format(number))
+        elif set(line) - set('#.'):
+            raise FontError('line {}: rows are made of # and .'.format(number))
+        else:
+            glyphs[-1][1].append([pixel == '#' for pixel in line])
+
+    if not glyphs:
+        raise FontError('no glyphs')
+
+    bitmaps = []
+    for char, rows in glyphs:
+        if len({len(row) for row in rows}) != 1:
+            raise FontError('glyph {!r}: rows of different widths'.format(char))
+        bitmaps.append(np.array(rows, dtype=bool))
+
+    if len({bitmap.shape[0] for bitmap in bitmaps}) != 1:
+        raise FontError('glyphs of different heights')
+
+    offsets = np.cumsum([0] + [bitmap.shape[1] for bitmap in bitmaps])
+    return Atlas(
+        np.concatenate(bitmaps, axis=1),
+        {char: (int(offset), bitmap.shape[1]) for (char, _), offset, bitmap in zip(glyphs, offsets, bitmaps)},
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def load_atlas(path):
+    '''Get the atlas of a font file.'''
+    with open(path, encoding='utf-8') as f:
+        source = f.read()
+
+    try:
+        return parse(source)
+    except FontError as e:
+        raise FontError('{}: {}'.format(path, e)) from e
+
+
+def blit(frame, bitmap, top, left):
+    '''Light the LEDs of a 2D boolean frame lit in bitmap, placed at (top, left) and clipped to the frame.'''
+    height, width = frame.shape
+    rows, columns = bitmap.shape
+    r0, c0 = max(top, 0), max(left, 0)
+    r1, c1 = min(top + rows, height), min(left + columns, width)
+    if r0 < r1 and c0 < c1:
+        frame[r0:r1, c0:c1] |= bitmap[r0 - top:r1 - top, c0 - left:c1 - left]
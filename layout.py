@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+'''
+Layout compiler.
+Turns a layout JSON file and the phrase rules of its language into a binary
+artifact holding the character grid, the mask of every word and the time table
+of the clock, so the application loads precomputed arrays instead of parsing
+and validating layouts.
+Artifacts are rebuilt automatically when the layout, its rules or the compiler change.
+'''
+
+# Imports
+import os
+import sys
+import json
+import hashlib
+import argparse
+import functools
+import numpy as np
+from geometry import get_geometry
+
+# Global variables
+CACHE = 'cache/layouts'
+
+# Phrase rules of the layouts, in this subdirectory of the layouts, by language
+RULES = 'rules'
+
+# Bump when the artifact content changes, so older artifacts are rebuilt
+VERSION = 4
+
+
+class LayoutError(ValueError):
+    '''Raised when a layout is malformed.'''
+
+
+class Layout:
+    '''Compiled layout of a panel: characters, word masks and clock time table.
+
+    A layout smaller than the panel is centered on it.
+    '''
+    def __init__(self, width, height, chars, names, masks):
+        self.width = width
+        self.height = height
+        self.number_of_pixels = width * height
+
+        # Character of every LED, empty where no word uses the LED
+        self.chars = chars
+
+        # Boolean mask of every word, named 'category/name'
+        self.names = list(names)
+        self.masks = masks
+        self._index = {name: i for i, name in enumerate(self.names)}
+
+        # Name of the phrase rules, None if the layout cannot tell the time
+        self.rules = None
+
+        # LED masks of every minute of the day and weekday, and of the minute dots
+        self.time = None
+        self.weekdays = None
+        self.minute_dots = None
+
+        for array in (chars, masks):
+            array.flags.writeable = False
+
+    def set_time(self, time, weekdays, minute_dots):
+        '''Set the compiled time table.'''
+        self.time = time
+        self.weekdays = weekdays
+        self.minute_dots = minute_dots
+
+        for array in (time, weekdays, minute_dots):
+            array.flags.writeable = False
+
+    def words(self, *keys):
+        '''Get the mask of the union of the words named 'category/name'.'''
+        mask = np.zeros(self.number_of_pixels, dtype=bool)
+        for key in keys:
+            if key not in self._index:
+                raise KeyError('Unknown word {}'.format(key))
+            mask |= self.masks[self._index[key]]
+
+        return mask
+
+
+# Function declarations
+
+
+def checksum(source, rules_source, width, height):
+    '''Identify the artifact built from the layout and rules source bytes for a panel size.'''
+    digest = hashlib.sha256(source)
+    digest.update(hashlib.sha256(rules_source).digest())
+    digest.update('{} {}x{}'.format(VERSION, width, height).encode())
+    return digest.hexdigest()
+
+
+def parse(source, width, height):
+    '''Parse and validate layout JSON, and get its characters, word names, masks and rules name.'''
+    try:
+        layout = json.loads(source)
+    except ValueError as e:
+        raise LayoutError('Invalid JSON: {}'.format(e)) from e
+    if not isinstance(layout, dict):
+        raise LayoutError('A layout is an object of categories')
+
+    rules = layout.pop('rules', None)
+    if rules is not None and not isinstance(rules, str):
+        raise LayoutError('rules must name a file of {}/'.format(RULES))
+
+    # Size of the layout, the panel size by default
+    size = layout.pop('width', width), layout.pop('height', height)
+    if not all(isinstance(value, int) and not isinstance(value, bool) and value > 0 for value in size):
+        raise LayoutError('width and height must be positive integers')
+    layout_width, layout_height = size
+    if layout_width > width or layout_height > height:
+        raise LayoutError('The {}x{} layout does not fit the {}x{} panel'.format(
+            layout_width, layout_height, width, height))
+
+    # Numbering of the word indexes, the default wiring unless the layout tells otherwise
+    start = layout.pop('start', 'bottom-right')
+    order = layout.pop('order', 'rows')
+    serpentine = layout.pop('serpentine', True)
+    if not isinstance(serpentine, bool):
+        raise LayoutError('serpentine must be true or false')
+    try:
+        geometry = get_geometry(layout_width, layout_height, start, order, serpentine)
+    except (TypeError, ValueError) as e:
+        raise LayoutError('Invalid numbering: {}'.format(e)) from e
+
+    # LED of the panel of every LED of the layout, centered
+    top = (height - layout_height) // 2
+    left = (width - layout_width) // 2
+    placement = get_geometry(width, height).index_map[geometry.rows + top, geometry.columns + left]
+
+    number_of_pixels = width * height
+    chars = np.full(number_of_pixels, '', dtype='<U1')
+    owners = [None] * number_of_pixels
+    names = []
+    masks = []
+
+    for category, words in layout.items():
+        if not isinstance(words, dict):
+            raise LayoutError('Category {} is not an object of words'.format(category))
+
+        for name, entry in words.items():
+            key = '{}/{}'.format(category, name)
+            word = entry.get('word') if isinstance(entry, dict) else None
+            index = entry.get('index') if isinstance(entry, dict) else None
+            if not isinstance(word, str) or not word:
+                raise LayoutError('{}: missing word'.format(key))
+            if not isinstance(index, int) or isinstance(index, bool):
+                raise LayoutError('{}: index must be an integer'.format(key))
+            if index < 0 or index + len(word) > layout_width * layout_height:
+                raise LayoutError('{}: LEDs {}-{} out of the {}x{} layout'.format(
+                    key, index, index + len(word) - 1, layout_width, layout_height))
+
+            leds = np.arange(index, index + len(word))
+            if len(np.unique(geometry.rows[leds])) != 1:
+                raise LayoutError('{}: {} does not fit on one row'.format(key, word))
+
+            # Characters are read left to right whatever the strip direction
+            leds = placement[leds[np.argsort(geometry.columns[leds])]]
+            for char, led in zip(word, leds):
+                if owners[led] is not None and chars[led] != char:
+                    raise LayoutError('{}: {} overlaps {} at LED {}'.format(key, word, owners[led], led))
+                chars[led] = char
+                owners[led] = key
+
+            mask = np.zeros(number_of_pixels, dtype=bool)
+            mask[leds] = True
+            names.append(key)
+            masks.append(mask)
+
+    masks = np.array(masks, dtype=bool).reshape(len(masks), number_of_pixels)
+    return chars, names, masks, rules
+
+
+def time_table(layout, rules):
+    '''Compile phrase rules to the LED masks of every minute of the day, the weekdays and the minute dots.
+
+    Rules give the words lit for each five minutes slot, each additional minute,
+    each hour and each weekday, as 'category/name' word keys. A slot with an
+    hour offset names the next hour, e.g. "twenty to five" at 4:40.
+    '''
+    try:
+        rules = json.loads(rules)
+    except ValueError as e:
+        raise LayoutError('Invalid rules JSON: {}'.format(e)) from e
+
+    def words(keys):
+        if not isinstance(keys, list):
+            raise LayoutError('Rules list words as "category/name" keys')
+        try:
+            return layout.words(*keys)
+        except KeyError as e:
+            raise LayoutError(e.args[0]) from e
+
+    def table(key, length):
+        entries = rules.get(key)
+        if not isinstance(entries, list) or len(entries) != length:
+            raise LayoutError('Rules need {} {} entries'.format(length, key))
+        return entries
+
+    minutes = table('minutes', 12)
+    additional_minutes = table('additional_minutes', 5)
+    prefix = words(rules.get('prefix', []))
+    hours = np.array([words(keys) for keys in table('hours', 24)])
+    weekdays = np.array([words(keys) for keys in table('weekdays', 7)])
+
+    # Masks of the sentence, hour and minutes of every minute of the day
+    minute_of_day = np.arange(24 * 60)
+    hour, minute = np.divmod(minute_of_day, 60)
+    offsets = np.array([slot.get('hour', 0) if isinstance(slot, dict) else 0 for slot in minutes])
+    slot_words = np.array([words(slot.get('words') if isinstance(slot, dict) else None) for slot in minutes])
+    additional_words = np.array([words(keys) for keys in additional_minutes])
+
+    time = (
+        prefix
+        | slot_words[minute // 5]
+        | additional_words[minute % 5]
+        | hours[(hour + offsets[minute // 5]) % 24]
+    )
+
+    # Words of the additional minutes, in order, painted with their own colors
+    keys = []
+    for entry in additional_minutes:
+        keys.extend(key for key in entry if key not in keys)
+    minute_dots = np.array([words([key]) for key in keys], dtype=bool).reshape(len(keys), layout.number_of_pixels)
+
+    return time, weekdays, minute_dots
+
+
+def read_rules(directory, rules):
+    '''Get the source of the named rules of the layouts in directory.'''
+    with open(os.path.join(directory, RULES, rules + '.json'), 'rb') as f:
+        return f.read()
+
+
+def compile_layout(source, width, height, directory='layouts'):
+    '''Compile layout JSON source to a Layout, raises LayoutError when malformed.'''
+    chars, names, masks, rules = parse(source, width, height)
+    layout = Layout(width, height, chars, names, masks)
+
+    if rules is not None:
+        try:
+            rules_source = read_rules(directory, rules)
+        except OSError as e:
+            raise LayoutError('Cannot read rules {}: {}'.format(rules, e)) from e
+
+        layout.rules = rules
+        layout.set_time(*time_table(layout, rules_source))
+
+    return layout
+
+
+def save(layout, path, digest):
+    '''Write a compiled layout to an artifact, atomically.'''
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    arrays = {
+        'checksum': np.array(digest),
+        'rules': np.array(layout.rules or ''),
+        'chars': layout.chars,
+        'names': np.array(layout.names, dtype=str),
+        'masks': np.packbits(layout.masks, axis=-1),
+    }
+    if layout.time is not None:
+        arrays['time'] = np.packbits(layout.time, axis=-1)
+        arrays['weekdays'] = np.packbits(layout.weekdays, axis=-1)
+        arrays['minute_dots'] = np.packbits(layout.minute_dots, axis=-1)
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+
+def load(path, source, width, height, directory='layouts'):
+    '''Read the compiled layout of source from an artifact, None when missing or stale.'''
+    try:
+        with np.load(path) as artifact:
+            rules = str(artifact['rules']) or None
+            rules_source = read_rules(directory, rules) if rules is not None else b''
+            if str(artifact['checksum']) != checksum(source, rules_source, width, height):
+                return None
+
+            unpack = functools.partial(np.unpackbits, axis=-1, count=width * height)
+            layout = Layout(
+                width,
+                height,
+                artifact['chars'],
+                artifact['names'].tolist(),
+                unpack(artifact['masks']).view(bool),
+            )
+            if rules is not None:
+                layout.rules = rules
+                layout.set_time(*(
+                    unpack(artifact[key]).view(bool)
+                    for key in ('time', 'weekdays', 'minute_dots')
+                ))
+
+            return layout
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def artifact_path(path, width, height, cache=CACHE):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache, '{}-{}x{}.npz'.format(name, width, height))
+
+
+@functools.lru_cache(maxsize=None)
+def load_layout(path, width, height, cache=CACHE):
+    '''Get the compiled layout of a panel size, compiling it when its artifact is missing or stale.'''
+    with open(path, 'rb') as f:
+        source = f.read()
+
+    directory = os.path.dirname(path)
+    artifact = artifact_path(path, width, height, cache)
+
+    layout = load(artifact, source, width, height, directory)
+    if layout is None:
+        try:
+            layout = compile_layout(source, width, height, directory)
+        except LayoutError as e:
+            raise LayoutError('{}: {}'.format(path, e)) from e
+
+        rules_source = read_rules(directory, layout.rules) if layout.rules is not None else b''
+        try:
+            save(layout, artifact, checksum(source, rules_source, width, height))
+        except OSError as e:
+            print('Could not write layout artifact: {}'.format(e))
+
+    return layout
+
+
+def parse_size(text):
+    width, _, height = text.partition('x')
+    return int(width), int(height)
+
+
+# Main body
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile and check word clock layouts.')
+    parser.add_argument('layouts', nargs='+', help='layout JSON files')
+    parser.add_argument('--size', default='12x12', help='panel size (default: %(default)s)')
+    parser.add_argument('--cache', default=CACHE, help='artifacts directory (default: %(default)s)')
+    args = parser.parse_args()
+
+    width, height = parse_size(args.size)
+    failed = False
+    for path in args.layouts:
+        try:
+            layout = load_layout(path, width, height, args.cache)
+        except (OSError, LayoutError) as e:
+            print(e)
+            failed = True
+            continue
+
+        print('{}: {} words{} -> {}'.format(
+            path,
+            len(layout.names),
+            ', {} rules'.format(layout.rules) if layout.rules is not None else '',
+            artifact_path(path, width, height, args.cache),
+        ))
+
+    sys.exit(1 if failed else 0)
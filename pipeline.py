@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+import threading
+import numpy as np
+
+
+class FrameRing:
+    '''Preallocated ring of frames handed from a render thread to the output thread.
+
+    Every frame has a deadline, when it should be shown, and an expiry, when the
+    next frame takes over. The render thread blocks while the ring is full.
+    '''
+    def __init__(self, size, number_of_pixels):
+        self.size = size
+        self.frames = np.zeros((size, number_of_pixels, 3), dtype=np.uint8)
+        self.deadlines = np.zeros(size, dtype=np.float64)
+        self.expiries = np.zeros(size, dtype=np.float64)
+
+        self._read = 0
+        self._count = 0
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return self._count
+
+    def acquire(self):
+        '''Get the slot to render the next frame in, waiting for a free one.'''
+        with self._condition:
+            self._condition.wait_for(lambda: self._count < self.size)
+            return (self._read + self._count) % self.size
+
+    def commit(self, deadline, expiry):
+        '''Hand the frame rendered in the acquired slot to the output thread.'''
+        with self._condition:
+            slot = (self._read + self._count) % self.size
+            self.deadlines[slot] = deadline
+            self.expiries[slot] = expiry
+            self._count += 1
+            self._condition.notify_all()
+
+    def get(self, timeout=None):
+        '''Get the slot of the oldest frame, None if no frame came within timeout seconds.'''
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._count > 0, timeout):
+                return None
+            return self._read
+
+    def release(self):
+        '''Free the slot of the oldest frame, once shown or dropped.'''
+        with self._condition:
+            self._read = (self._read + 1) % self.size
+            self._count -= 1
+            self._condition.notify_all()
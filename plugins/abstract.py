@@ -4,15 +4,115 @@ import abc
 import numpy as np
 import time
 from enum import Enum
+from geometry import get_geometry
+from settings import Settings
+
+
+# Rainbow palette, one color per column of a 12 columns panel
+RAINBOW = (
+    (139, 0, 0),      # darkred
+    (255, 69, 0),     # orangered
+    (255, 215, 0),    # gold
+    (124, 252, 0),    # lawngreen
+    (34, 139, 34),    # forestgreen
+    (32, 178, 170),   # lightseagreen
+    (0, 139, 139),    # darkcyan
+    (25, 25, 112),    # midnightblue
+    (75, 0, 130),     # indigo
+    (139, 0, 139),    # darkmagenta
+    (199, 21, 133),   # mediumvioletred
+    (250, 128, 114),  # salmon
+)
+
+
+def gradient(colors, count):
+    '''Get count colors evenly spread over the gradient through colors, as an array of shape (count, 3).
+
+    With as many colors as count, the colors are returned unchanged.
+    '''
+    colors = np.asarray(colors, dtype=np.float64)
+    anchors = np.linspace(0, 1, len(colors))
+    positions = np.linspace(0, 1, count)
+    channels = [np.interp(positions, anchors, colors[:, channel]) for channel in range(3)]
+    return np.rint(np.stack(channels, axis=-1)).astype(np.uint8)
+
+
+def rgb2hex(rgb):
+    return '#{:02x}{:02x}{:02x}'.format(rgb[0], rgb[1], rgb[2])
+
+
+def getcolor(color):
+    '''Parse a #rgb or #rrggbb color to an RGB tuple, other specifiers are resolved by PIL.
+
+    Raises ValueError for an invalid color.
+    '''
+    color = color.strip()
+    if color.startswith('#') and len(color) in (4, 7):
+        digits = color[1:]
+        if len(digits) == 3:
+            digits = ''.join(digit * 2 for digit in digits)
+        return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+
+    from PIL import ImageColor
+
+    return ImageColor.getcolor(color, 'RGB')
+
+
+class Compositor:
+    '''Build frames from boolean LED masks using precomputed color layers.'''
+    def __init__(self, number_of_pixels):
+        self.number_of_pixels = number_of_pixels
+        self._on = np.zeros((number_of_pixels, 3), dtype=np.uint8)
+        self._off = np.zeros(3, dtype=np.uint8)
+
+    @property
+    def off_color(self):
+        return self._off
+
+    @off_color.setter
+    def off_color(self, color):
+        self._off = np.array(color, dtype=np.uint8)
+
+    def paint(self, colors, mask=None):
+        '''Set the lit color of the LEDs in mask (all LEDs if None), from one color or a color per LED.'''
+        colors = np.asarray(colors, dtype=np.uint8)
+        if mask is None:
+            self._on[:] = colors
+        elif colors.ndim == 1:
+            self._on[mask] = colors
+        else:
+            self._on[mask] = colors[mask]
+
+    def compose(self, mask, out=None):
+        '''Build frames for a boolean mask of shape (..., number_of_pixels).'''
+        if out is None:
+            out = np.empty(mask.shape + (3,), dtype=np.uint8)
+        
+        out[...] = self._off
+        np.copyto(out, self._on, where=mask[..., None])
+        
+        return out
 
 
 class AbstractPlugin(abc.ABC):
-    def __init__(self, width=16, height=16):
+    def __init__(self, width=12, height=12, config=None):
         self.width = width
         self.height = height
         self.number_of_pixels = self.height * self.width
+
+        if config is None:
+            config = Settings('settings.conf')
+        self.config = config
         self._buffer = np.zeros((self.height, self.width, 3), dtype=np.uint8)
         self.fps = 0
+        self.dirty = True
+
+        # Seconds ahead of the current time the next frame is rendered for
+        self.ahead = 0.0
+
+        # Layouts and plugin buffers use the default wiring
+        self.geometry = get_geometry(self.width, self.height)
+        self.columns = self.geometry.columns
 
     @property
     def buffer(self):
@@ -22,10 +122,29 @@ class AbstractPlugin(abc.ABC):
     def clear_buffer(self):
         '''Clear the source buffer by filling it with zeros.'''
         self._buffer = np.zeros_like(self._buffer)
+        self.dirty = True
 
     @abc.abstractmethod
     def update(self, dt):
-        '''Update the source by passing current dt.'''
+        '''Update the source by passing current dt. Sets dirty when the buffer changed.'''
+
+    def next_update(self):
+        '''Seconds until the buffer may change and update should be called again, None if never.'''
+        if self.fps:
+            return 1 / self.fps
+        return None
+
+    def prepare(self):
+        '''Get ready to be shown soon: start fetching data and render the first frame.'''
+        self.update(0)
+
+    def ready(self):
+        '''Whether the first frame is rendered from up to date data.'''
+        return True
+
+    def requested(self):
+        '''Whether the plugin asks to be shown now, e.g. to raise an alert.'''
+        return False
 
     @abc.abstractproperty
     def topics(self):
@@ -4,171 +4,72 @@
 import time
 import numpy as np
 import datetime
-from plugins.abstract import AbstractPlugin
-import json
-import configparser
-from PIL import ImageColor
+from plugins.abstract import AbstractPlugin, Compositor, RAINBOW, getcolor, gradient, rgb2hex
+from layout import LayoutError, load_layout
 
-def indexes(entry):
-    '''Words to LED indexes mapping.'''
-    word = entry['word']
-    index = entry['index']
-    length = len(word)
-    
-    return [*range(index, index + length)]
+# Minutes of a week, the states of the clock
+MINUTES_PER_WEEK = 7 * 24 * 60
 
-
-def rgb2hex(rgb):
-    return '#{:02x}{:02x}{:02x}'.format(rgb[0], rgb[1], rgb[2])
+# Colors of the minute dots, spread over the dots of the layout
+MINUTE_COLORS = (
+    RAINBOW[9],   # darkmagenta
+    RAINBOW[0],   # darkred
+    RAINBOW[2],   # gold
+    RAINBOW[11],  # salmon
+)
 
 
 class ClockPlugin(AbstractPlugin):
-    def __init__(self, width=16, height=16):
+    def __init__(self, width=12, height=12, config=None):
         '''Init the class'''
-        super().__init__(width, height)
-        self.config = configparser.ConfigParser()
-        self.config.read('settings.conf')
+        super().__init__(width, height, config)
         self.section = 'clock'
 
         self.fps = 5
 
-        self._sim_hour = 0
+        # Minute of the week of the simulated time, from Monday 0:00, one minute per frame at fps
         self._sim_minute = 0
-        self._sim_second = 0
-        self._sim_weekday = 0
-
-        self.minutes = []
-        self.additional_minutes = []
-        self.hours = []
-        self.weekdays = []
-        self.prefix = []
-        # self.soon = []
-        # self.signature = []
+        self._sim_elapsed = 0.0
+
+        self.time = None
+        self.weekdays = None
         self.simulate = self.config.getboolean(self.section, 'simulate')
-        self._on_color = ImageColor.getcolor(self.config.get(self.section, 'on_rgb'), 'RGB')
-        self._off_color = ImageColor.getcolor(self.config.get(self.section, 'off_rgb'), 'RGB')
-        self._day_color = ImageColor.getcolor(self.config.get(self.section, 'day_rgb'), 'RGB')
-        self._minute_color = ImageColor.getcolor(self.config.get(self.section, 'minute_rgb'), 'RGB')
-        # self._signature_color = ImageColor.getcolor(self.config.get(self.section, 'signature_rgb'), 'RGB')
+        self._on_color = getcolor(self.config.get(self.section, 'on_rgb'))
+        self._off_color = getcolor(self.config.get(self.section, 'off_rgb'))
+        self._day_color = getcolor(self.config.get(self.section, 'day_rgb'))
+        self._minute_color = getcolor(self.config.get(self.section, 'minute_rgb'))
+        # self._signature_color = getcolor(self.config.get(self.section, 'signature_rgb'))
         self._rainbow = self.config.getboolean(self.section, 'rainbow')
         
-        # TODO : only compatible with 12 columns for now
-        self.rainbow_colors = [
-            ImageColor.getcolor('darkred', 'RGB'),
-            ImageColor.getcolor('orangered', 'RGB'),
-            ImageColor.getcolor('gold', 'RGB'),
-            ImageColor.getcolor('lawngreen', 'RGB'),
-            ImageColor.getcolor('forestgreen', 'RGB'),
-            ImageColor.getcolor('lightseagreen', 'RGB'),
-            ImageColor.getcolor('darkcyan', 'RGB'),
-            ImageColor.getcolor('midnightblue', 'RGB'),
-            ImageColor.getcolor('indigo', 'RGB'),
-            ImageColor.getcolor('darkmagenta', 'RGB'),
-            ImageColor.getcolor('mediumvioletred', 'RGB'),
-            ImageColor.getcolor('salmon', 'RGB'),
-        ]
-        
-        self.additional_minutes_colors = [
-            ImageColor.getcolor('darkmagenta', 'RGB'),
-            ImageColor.getcolor('darkred', 'RGB'),
-            ImageColor.getcolor('gold', 'RGB'),
-            ImageColor.getcolor('salmon', 'RGB'),
-        ]
+        # One color per column, spread over the rainbow whatever the width
+        self.rainbow_colors = gradient(RAINBOW, self.width)
         
+        self.additional_minutes_colors = []
         self.additional_minutes_index = []
         self.weekdays_index = []
 
+        # Color layers, prepared on first update and whenever a color changes
+        self._compositor = None
+        self._key = None
+
+        # Frame of the current minute, composed in place when the minute changes
+        self._mask = np.zeros(self.number_of_pixels, dtype=bool)
+        self._buffer = np.zeros((self.number_of_pixels, 3), dtype=np.uint8)
+
         self.__construct_word_arrays()
 
     def __construct_word_arrays(self):
-        f = open('layouts/french.json', encoding='utf-8')
-        layout = json.load(f)
-
-        self.prefix = indexes(layout['prefix']['it']) + indexes(layout['prefix']['is'])
-        # self.soon = indexes(layout['prefix']['soon'])
-        # self.signature = indexes(layout['others']['signature'])
-
-        self.minutes = [
-            indexes(layout['minutes']['oclock']),
-            indexes(layout['minutes']['five']),
-            indexes(layout['minutes']['ten']),
-            indexes(layout['minutes']['and']) + indexes(layout['minutes']['quarter']),
-            indexes(layout['minutes']['twenty']),
-            indexes(layout['minutes']['twenty']) + indexes(layout['minutes']['five']),
-            indexes(layout['minutes']['and']) + indexes(layout['minutes']['half']),
-            indexes(layout['minutes']['to'])
-            + indexes(layout['minutes']['twenty'])
-            + indexes(layout['minutes']['five']),
-            indexes(layout['minutes']['to']) + indexes(layout['minutes']['twenty']),
-            indexes(layout['minutes']['to'])
-            + indexes(layout['minutes']['the'])
-            + indexes(layout['minutes']['quarter']),
-            indexes(layout['minutes']['to']) + indexes(layout['minutes']['ten']),
-            indexes(layout['minutes']['to']) + indexes(layout['minutes']['five']),
-        ]
-        self.additional_minutes = [
-            [],
-            indexes(layout['minutes']['one']),
-            indexes(layout['minutes']['one'])
-            + indexes(layout['minutes']['two']),
-            indexes(layout['minutes']['one'])
-            + indexes(layout['minutes']['two'])
-            + indexes(layout['minutes']['three']),
-            indexes(layout['minutes']['one'])
-            + indexes(layout['minutes']['two'])
-            + indexes(layout['minutes']['three'])
-            + indexes(layout['minutes']['four']),
-        ]
-        self.additional_minutes_index = [
-            layout['minutes']['one']['index'],
-            layout['minutes']['two']['index'],
-            layout['minutes']['three']['index'],
-            layout['minutes']['four']['index'],
-        ]
-        self.hours = [
-            indexes(layout['hours']['midnight']),
-            indexes(layout['hours']['one']) + indexes(layout['hours']['hour']),
-            indexes(layout['hours']['two']) + indexes(layout['hours']['hours']),
-            indexes(layout['hours']['three']) + indexes(layout['hours']['hours']),
-            indexes(layout['hours']['four']) + indexes(layout['hours']['hours']),
-            indexes(layout['hours']['five']) + indexes(layout['hours']['hours']),
-            indexes(layout['hours']['six']) + indexes(layout['hours']['hours']),
-            indexes(layout['hours']['seven']) + indexes(layout['hours']['hours']),
-            indexes(layout['hours']['eight']) + indexes(layout['hours']['hours']),
-            indexes(layout['hours']['nine']) + indexes(layout['hours']['hours']),
-            indexes(layout['hours']['ten']) + indexes(layout['hours']['hours']),
-            indexes(layout['hours']['eleven']) + indexes(layout['hours']['hours']),
-            indexes(layout['hours']['midday']),
-            indexes(layout['hours']['one']) + indexes(layout['hours']['hour']),
-            indexes(layout['hours']['two']) + indexes(layout['hours']['hours']),
-            indexes(layout['hours']['three']) + indexes(layout['hours']['hours']),
-            indexes(layout['hours']['four']) + indexes(layout['hours']['hours']),
-            indexes(layout['hours']['five']) + indexes(layout['hours']['hours']),
-            indexes(layout['hours']['six']) + indexes(layout['hours']['hours']),
-            indexes(layout['hours']['seven']) + indexes(layout['hours']['hours']),
-            indexes(layout['hours']['eight']) + indexes(layout['hours']['hours']),
-            indexes(layout['hours']['nine']) + indexes(layout['hours']['hours']),
-            indexes(layout['hours']['ten']) + indexes(layout['hours']['hours']),
-            indexes(layout['hours']['eleven']) + indexes(layout['hours']['hours']),
-        ]
-        self.weekdays = [
-            indexes(layout['day']['monday']),
-            indexes(layout['day']['tuesday']),
-            indexes(layout['day']['wednesday']),
-            indexes(layout['day']['thursday']),
-            indexes(layout['day']['friday']),
-            indexes(layout['day']['saturday']),
-            indexes(layout['day']['sunday']),
-        ]
-        self.weekdays_index = [
-            layout['day']['monday']['index'],
-            layout['day']['tuesday']['index'],
-            layout['day']['wednesday']['index'],
-            layout['day']['thursday']['index'],
-            layout['day']['friday']['index'],
-            layout['day']['saturday']['index'],
-            layout['day']['sunday']['index'],
-        ]
+        path = self.config.get('display', 'layout', fallback='layouts/french.json')
+        layout = load_layout(path, self.width, self.height)
+        if layout.time is None:
+            raise LayoutError('{} has no phrase rules, it cannot tell the time'.format(path))
+
+        # Sentence of every minute of the day, and words of every weekday
+        self.time = layout.time
+        self.weekdays = layout.weekdays
+        self.additional_minutes_index = list(layout.minute_dots)
+        self.additional_minutes_colors = gradient(MINUTE_COLORS, len(self.additional_minutes_index))
+        self.weekdays_index = layout.weekdays.any(axis=0)
 
     @property
     def on_color(self):
@@ -177,6 +78,7 @@ class ClockPlugin(AbstractPlugin):
     @on_color.setter
     def on_color(self, color):
         self._on_color = color
+        self._compositor = None
 
     @property
     def off_color(self):
@@ -185,6 +87,7 @@ class ClockPlugin(AbstractPlugin):
     @off_color.setter
     def off_color(self, color):
         self._off_color = color
+        self._compositor = None
 
     @property
     def day_color(self):
@@ -193,6 +96,7 @@ class ClockPlugin(AbstractPlugin):
     @day_color.setter
     def day_color(self, color):
         self._day_color = color
+        self._compositor = None
         
     @property
     def minute_color(self):
@@ -201,6 +105,7 @@ class ClockPlugin(AbstractPlugin):
     @minute_color.setter
     def minute_color(self, color):
         self._minute_color = color
+        self._compositor = None
 
     # @property
     # def signature_color(self):
@@ -217,6 +122,7 @@ class ClockPlugin(AbstractPlugin):
     @rainbow.setter
     def rainbow(self, boolean):
         self._rainbow = boolean
+        self._compositor = None
 
     @property
     def topics(self):
@@ -247,7 +153,7 @@ class ClockPlugin(AbstractPlugin):
                 
         else:
             try:
-                color = ImageColor.getcolor(msg.payload.decode('utf-8'), 'RGB')
+                color = getcolor(msg.payload.decode('utf-8'))
                 if msg.topic == 'wordclock/plugin/clock/on':
                     self.on_color = color
                     self.config.set(self.section, 'on_rgb', rgb2hex(self.on_color))
@@ -255,10 +161,10 @@ class ClockPlugin(AbstractPlugin):
                     self.off_color = color
                     self.config.set(self.section, 'off_rgb', rgb2hex(self.off_color))
                 elif msg.topic == 'wordclock/plugin/clock/day':
-                    self._day_color = color
+                    self.day_color = color
                     self.config.set(self.section, 'day_rgb', rgb2hex(self.day_color))
                 elif msg.topic == 'wordclock/plugin/clock/minute':
-                    self._minutes_color = color
+                    self.minute_color = color
                     self.config.set(self.section, 'minute_rgb', rgb2hex(self.minute_color))
                 # elif msg.topic == 'wordclock/plugin/clock/signature':
                     # self._signature_color = color
@@ -266,91 +172,91 @@ class ClockPlugin(AbstractPlugin):
             except ValueError as ve:
                 print('Invalid RGB value')
 
-        with open('settings.conf', 'w') as configfile:
-            self.config.write(configfile)
-
     def update(self, dt):
-        '''Update the source. Checks current time and refreshes the internal buffer.'''
+        '''Update the source. Checks current time and selects the matching frame.'''
         hour, minute, second, weekday = (
-            self.__getCurrentTime() if not self.simulate else self.__getSimulateTime()
+            self.__getCurrentTime() if not self.simulate else self.__getSimulateTime(dt)
         )
-        self._buffer = self.__construct_buffer(hour, minute, second, weekday)
 
-    def __getCurrentTime(self):
-        '''Get current time information.'''
-        now = datetime.datetime.now().time()
-        weekday = datetime.datetime.now().weekday()
-        return now.hour, now.minute, now.second, weekday
-
-    def __getSimulateTime(self):
-        '''Get simulated time information.'''
-        self._sim_hour += 1
-        if self._sim_hour % 24 == 0:
-            self._sim_minute += 1
-            self._sim_weekday += 1
-            if self._sim_minute % 60 == 0:
-                self._sim_second += 30
-
-        return (
-            self._sim_hour % 24,
-            self._sim_minute % 60,
-            self._sim_second % 60,
-            self._sim_weekday % 7,
-        )
-
-    def __constructIndexes(self, hour, minute, second, weekday):
-        '''Get array of indexes which map with words to light up.'''
-        # Check if an hour should be added
-        additional_hour = 1 if (minute >= 35) else 0
-
-        hour_index = (hour + additional_hour) % 24
-        minute_index = (minute % 60) // 5
-        additional_minute_index = minute % 5
-        # soon = []
-        # if minute / 5 % 1 > 0.7:
-        #     minute_index += 1
-        #     soon = self.soon
+        compositor = self.__colors()
+        key = self.__frame_key(hour, minute, second, weekday)
+        if key != self._key:
+            self._key = key
+            weekday, minute_of_day = key
+            np.bitwise_or(self.time[minute_of_day], self.weekdays[weekday], out=self._mask)
+            compositor.compose(self._mask, out=self._buffer)
+            self.dirty = True
+
+    def render_week(self, out=None):
+        '''Render the frame of every minute of the week, from Monday 0:00.
+
+        The frames are composed a day at a time into out when given, of shape
+        (MINUTES_PER_WEEK, number_of_pixels, 3).
+        '''
+        if out is None:
+            out = np.empty((MINUTES_PER_WEEK, self.number_of_pixels, 3), dtype=np.uint8)
+
+        weekday, minute_of_day = np.divmod(np.arange(MINUTES_PER_WEEK), 24 * 60)
+        hour, minute = np.divmod(minute_of_day, 60)
+        weekday, minute_of_day = self.__frame_key(hour, minute, 0, weekday)
+
+        compositor = self.__colors()
+        for day in range(0, MINUTES_PER_WEEK, 24 * 60):
+            minutes = slice(day, day + 24 * 60)
+            mask = self.time[minute_of_day[minutes]] | self.weekdays[weekday[minutes]]
+            compositor.compose(mask, out=out[minutes])
+        return out
+
+    def next_update(self):
+        '''Seconds until the next minute starts, the displayed text does not change before.'''
+        if self.simulate:
+            return 1 / self.fps
         
-        return (
-            self.prefix
-            + self.minutes[minute_index]
-            + self.additional_minutes[additional_minute_index]
-            + self.hours[hour_index]
-            + self.weekdays[weekday]
-            # + soon
-            # + self.signature
-        )
+        now = self.__now()
+        return 60 - now.second - now.microsecond / 1e6
 
-    def __construct_buffer(self, hour, minute, second, weekday):
-        '''Construct display buffer given the current time and weekday.'''
-        buffer = np.zeros((self.number_of_pixels, 3), dtype=np.uint8)
-        led_indexes = self.__constructIndexes(hour, minute, second, weekday)
-        
-        for index in range(self.number_of_pixels):
-            if index in led_indexes:
-                if index in self.additional_minutes_index:
-                    if self.rainbow:
-                        buffer[index] = self.additional_minutes_colors[self.additional_minutes_index.index(index)]
-                    else:
-                        buffer[index] = self.minute_color
-                
-                elif index in self.weekdays_index:
-                    buffer[index] = self.day_color
-                
-                else:
-                    if self.rainbow:
-                        row = (self.number_of_pixels - 1 - index) // self.width
-                        if (row - self.height + 1) % 2 == 0:
-                            column = (self.number_of_pixels - 1 - index) % self.width
-                        else:
-                            column = index % self.width
-                        
-                        buffer[index] = self.rainbow_colors[column]
-                    
-                    else:
-                        buffer[index] = self.on_color
-                
-            else:
-                buffer[index] = self.off_color
+    def __getCurrentTime(self):
+        '''Get current time information.'''
+        now = self.__now()
+        return now.hour, now.minute, now.second, now.weekday()
+
+    def __now(self):
+        '''Get the date and time the frame is rendered for.'''
+        return datetime.datetime.now() + datetime.timedelta(seconds=self.ahead)
+
+    def __getSimulateTime(self, dt):
+        '''Get simulated time information, one minute later for every frame period of the dt milliseconds elapsed.'''
+        minutes, self._sim_elapsed = divmod(self._sim_elapsed + dt, 1000 / self.fps)
+        self._sim_minute = (self._sim_minute + int(minutes)) % MINUTES_PER_WEEK
+        weekday, minute_of_day = divmod(self._sim_minute, 24 * 60)
+        hour, minute = divmod(minute_of_day, 60)
+
+        return hour, minute, 0, weekday
+
+    def __frame_key(self, hour, minute, second, weekday):
+        '''Get the (weekday, minute of the day) key of the frame matching the given time.'''
+        return weekday, hour * 60 + minute
+
+    def __colors(self):
+        '''Get the color layers, prepared again after a color change.'''
+        if self._compositor is None:
+            self._compositor = self.__construct_compositor()
+            self._key = None
+
+        return self._compositor
+
+    def __construct_compositor(self):
+        '''Prepare the color layers used to compose frames.'''
+        compositor = Compositor(self.number_of_pixels)
+        compositor.off_color = self.off_color
+        if self.rainbow:
+            compositor.paint(self.rainbow_colors[self.columns])
+            for mask, color in zip(self.additional_minutes_index, self.additional_minutes_colors):
+                compositor.paint(color, mask)
+        else:
+            compositor.paint(self.on_color)
+            for mask in self.additional_minutes_index:
+                compositor.paint(self.minute_color, mask)
+        compositor.paint(self.day_color, self.weekdays_index)
 
-        return buffer
+        return compositor
@@ -4,272 +4,58 @@
 import time
 import numpy as np
 import datetime
-from plugins.abstract import AbstractPlugin
+from plugins.abstract import AbstractPlugin, Compositor, RAINBOW, getcolor, gradient, rgb2hex
 import json
-import configparser
-import pyowm
-from PIL import ImageColor
+import threading
+from glyphs import blit, load_atlas
+from plugins.weather import WeatherError, create_cache, create_provider
+
+# Glyphs of the digits and units
+FONT = 'fonts/digits.txt'
 
-def indexes(entry):
-    '''Words to LED indexes mapping.'''
-    word = entry['word']
-    index = entry['index']
-    length = len(word)
-    
-    return [*range(index, index + length)]
 
-# TODO : only compatible with 12x12
 class TemperaturePlugin(AbstractPlugin):
-    def __init__(self, width=16, height=16):
+    def __init__(self, width=12, height=12, config=None):
         '''Init the class'''
-        super().__init__(width, height)
-        self.config = configparser.ConfigParser()
-        self.config.read('settings.conf')
+        super().__init__(width, height, config)
         self.section = 'temperature'
 
         self.fps = 1
 
-        self.api_key = self.config.get(self.section, 'api_key')
         self._location = self.config.get(self.section, 'location')
         
-        self.owm = pyowm.OWM(self.api_key).weather_manager()
+        # The provider may import heavy libraries, it is created by the worker on first fetch
+        self.cache = create_cache(self.config, self.section)
+        self.provider = None
 
-        self._on_color = ImageColor.getcolor(self.config.get(self.section, 'on_rgb'), 'RGB')
-        self._off_color = ImageColor.getcolor(self.config.get(self.section, 'off_rgb'), 'RGB')
+        self._on_color = getcolor(self.config.get(self.section, 'on_rgb'))
+        self._off_color = getcolor(self.config.get(self.section, 'off_rgb'))
+        self._stale_color = getcolor(self.config.get(self.section, 'stale_rgb', fallback='#444'))
         self._rainbow = self.config.getboolean(self.section, 'rainbow')
         
-        # TODO : only compatible with 12 columns for now
-        self.rainbow_colors = [
-            ImageColor.getcolor('darkred', 'RGB'),
-            ImageColor.getcolor('orangered', 'RGB'),
-            ImageColor.getcolor('gold', 'RGB'),
-            ImageColor.getcolor('lawngreen', 'RGB'),
-            ImageColor.getcolor('forestgreen', 'RGB'),
-            ImageColor.getcolor('lightseagreen', 'RGB'),
-            ImageColor.getcolor('darkcyan', 'RGB'),
-            ImageColor.getcolor('midnightblue', 'RGB'),
-            ImageColor.getcolor('indigo', 'RGB'),
-            ImageColor.getcolor('darkmagenta', 'RGB'),
-            ImageColor.getcolor('mediumvioletred', 'RGB'),
-            ImageColor.getcolor('salmon', 'RGB'),
-        ]
+        # Temperature is fetched in the background and kept for ttl seconds
+        self.ttl = self.config.getint(self.section, 'ttl', fallback=600)
+        self.retry = self.config.getint(self.section, 'retry', fallback=60)
+        self._reading = self.__cached_reading(self._location)
+        self._failed = False
+        self._pending = False
+        self._last_attempt = None
+        self._refresh = threading.Event()
+        self._worker = None
         
-        self.__mapping_row_column_to_index()
-        self.__construct_numbers_array()
-
-    def __mapping_row_column_to_index(self):
-        self.rc_map = np.zeros((self.height, self.width), dtype=np.uint8)
-        for index in range(self.number_of_pixels):
-            r = (self.number_of_pixels - 1 - index) // self.width
-            
-            if (r - self.height + 1) % 2 == 0:
-                c = (self.number_of_pixels - 1 - index) % self.width
-            else:
-                c = index % self.width
-                
-            self.rc_map[r, c] = index
+        # One color per column, spread over the rainbow whatever the width
+        self.rainbow_colors = gradient(RAINBOW, self.width)
         
-        return
+        # Color layers, rebuilt whenever a color changes
+        self._compositor = None
+        self._stale_compositor = None
+        self._state = None
 
-    def __construct_numbers_array(self):
-        self.numbers = [[] for _ in range(10)]
-        
-        self.numbers[0] = [
-            (2, 1),
-            (2, 2),
-            (2, 3),
-            (2, 4),
-            (3, 1),
-            (4, 1),
-            (5, 1),
-            (6, 1),
-            (5, 4),
-            (7, 1),
-            (6, 4),
-            (7, 4),
-            (8, 1),
-            (8, 2),
-            (8, 3),
-            (8, 4),
-            (3, 4),
-            (4, 4),
-        ]
-        
-        self.numbers[1] = [
-            (2, 4),
-            (3, 4),
-            (4, 4),
-            (5, 4),
-            (6, 4),
-            (7, 4),
-            (8, 4),
-        ]
-        
-        self.numbers[2] = [
-            (2, 1),
-            (2, 2),
-            (2, 3),
-            (2, 4),
-            (3, 4),
-            (4, 4),
-            (5, 4),
-            (5, 1),
-            (5, 2),
-            (5, 3),
-            (6, 1),
-            (7, 1),
-            (8, 1),
-            (8, 2),
-            (8, 3),
-            (8, 4),
-        ]
-        
-        self.numbers[3] = [
-            (2, 1),
-            (2, 2),
-            (2, 3),
-            (2, 4),
-            (3, 4),
-            (4, 4),
-            (5, 4),
-            (5, 1),
-            (5, 2),
-            (5, 3),
-            (6, 4),
-            (7, 4),
-            (8, 1),
-            (8, 2),
-            (8, 3),
-            (8, 4),
-        ]
-        
-        self.numbers[4] = [
-            (2, 4),
-            (3, 4),
-            (4, 4),
-            (5, 4),
-            (6, 4),
-            (7, 4),
-            (8, 4),
-            (2, 1),
-            (3, 1),
-            (4, 1),
-            (5, 1),
-            (5, 2),
-            (5, 3),
-        ]
-        
-        self.numbers[5] = [
-            (2, 1),
-            (2, 2),
-            (2, 3),
-            (2, 4),
-            (3, 1),
-            (4, 1),
-            (5, 1),
-            (5, 2),
-            (5, 3),
-            (5, 4),
-            (6, 4),
-            (7, 4),
-            (8, 1),
-            (8, 2),
-            (8, 3),
-            (8, 4),
-        ]
-        
-        self.numbers[6] = [
-            (2, 1),
-            (2, 2),
-            (2, 3),
-            (2, 4),
-            (3, 1),
-            (4, 1),
-            (5, 1),
-            (5, 2),
-            (5, 3),
-            (5, 4),
-            (6, 1),
-            (6, 4),
-            (7, 4),
-            (7, 1),
-            (8, 1),
-            (8, 2),
-            (8, 3),
-            (8, 4),
-        ]
-        
-        self.numbers[7] = [
-            (2, 1),
-            (2, 2),
-            (2, 3),
-            (2, 4),
-            (3, 4),
-            (4, 4),
-            (5, 4),
-            (6, 4),
-            (7, 4),
-            (8, 4),
-        ]
-        
-        self.numbers[8] = [
-            (2, 1),
-            (2, 2),
-            (2, 3),
-            (2, 4),
-            (3, 1),
-            (4, 1),
-            (5, 1),
-            (5, 2),
-            (5, 3),
-            (6, 1),
-            (5, 4),
-            (7, 1),
-            (6, 4),
-            (7, 4),
-            (8, 1),
-            (8, 2),
-            (8, 3),
-            (8, 4),
-            (3, 4),
-            (4, 4),
-        ]
-        
-        self.numbers[9] = [
-            (2, 1),
-            (2, 2),
-            (2, 3),
-            (2, 4),
-            (3, 4),
-            (4, 4),
-            (5, 4),
-            (6, 4),
-            (7, 4),
-            (8, 4),
-            (3, 1),
-            (4, 1),
-            (5, 1),
-            (5, 2),
-            (5, 3),
-        ]
-        
-        self.minus = [
-            (5, 1),
-            (5, 2),
-            (5, 3),
-            (5, 4),
-            (6, 1),
-            (6, 2),
-            (6, 3),
-            (6, 4),
-        ]
-        
-        self.degree = [
-            (2, 7),
-            (2, 8),
-            (3, 7),
-            (3, 8),
-        ]
+        # Temperature text, drawn centered in a 2D frame
+        self.atlas = load_atlas(self.config.get(self.section, 'font', fallback=FONT))
+        self.decimals = self.config.getint(self.section, 'decimals', fallback=0)
+        self.unit = self.config.get(self.section, 'unit', fallback='°', raw=True)
+        self._grid = np.zeros((self.height, self.width), dtype=bool)
 
     @property
     def on_color(self):
@@ -278,6 +64,7 @@ class TemperaturePlugin(AbstractPlugin):
     @on_color.setter
     def on_color(self, color):
         self._on_color = color
+        self._compositor = None
 
     @property
     def off_color(self):
@@ -286,6 +73,16 @@ class TemperaturePlugin(AbstractPlugin):
     @off_color.setter
     def off_color(self, color):
         self._off_color = color
+        self._compositor = None
+
+    @property
+    def stale_color(self):
+        return self._stale_color
+
+    @stale_color.setter
+    def stale_color(self, color):
+        self._stale_color = color
+        self._compositor = None
         
     @property
     def rainbow(self):
@@ -294,6 +91,7 @@ class TemperaturePlugin(AbstractPlugin):
     @rainbow.setter
     def rainbow(self, boolean):
         self._rainbow = boolean
+        self._compositor = None
     
     @property
     def location(self):
@@ -303,6 +101,17 @@ class TemperaturePlugin(AbstractPlugin):
     def location(self, location):
         self._location = location
 
+    @property
+    def stale(self):
+        '''Whether the displayed temperature is missing, outdated or from another location.'''
+        reading = self._reading
+        return (
+            reading is None
+            or reading[1] != self._location
+            or time.time() - reading[2] >= self.ttl
+            or self._failed
+        )
+
     @property
     def topics(self):
         return [
@@ -324,140 +133,127 @@ class TemperaturePlugin(AbstractPlugin):
                 txt = msg.payload.decode('utf-8')
                 boolean = txt.lower() == 'true'
                 self.rainbow = boolean
-                self.config.set(self.section, 'rainbow', boolean)
+                self.config.set(self.section, 'rainbow', txt)
             except:
                 print('Invalid boolean')
         
         elif msg.topic == 'wordclock/plugin/temperature/location':
-            try:
-                location = msg.payload.decode('utf-8')
-                old_location = self.location
-                self.location = location
-                self.__getTemperature()
-                self.config.set(self.section, 'location', location)
-                     
-            except pyowm.commons.exceptions.PyOWMError:
-                print('Invalid location')
-                self.location = old_location
+            location = msg.payload.decode('utf-8')
+            self.location = location
+            self.config.set(self.section, 'location', location)
+            reading = self.__cached_reading(location)
+            if reading is not None:
+                self._reading = reading
+            self.refresh()
                 
         else:
             try:
-                color = ImageColor.getcolor(msg.payload.decode('utf-8'), 'RGB')
-                if msg.topic == 'wordclock/plugin/clock/on':
+                color = getcolor(msg.payload.decode('utf-8'))
+                if msg.topic == 'wordclock/plugin/temperature/on':
                     self.on_color = color
                     self.config.set(self.section, 'on_rgb', rgb2hex(self.on_color))
-                elif msg.topic == 'wordclock/plugin/clock/off':
+                elif msg.topic == 'wordclock/plugin/temperature/off':
                     self.off_color = color
                     self.config.set(self.section, 'off_rgb', rgb2hex(self.off_color))
             except ValueError as ve:
                 print('Invalid RGB value')
 
-        with open('settings.conf', 'w') as configfile:
-            self.config.write(configfile)
-
     def update(self, dt):
-        '''Update the source. Checks current temperature and refreshes the internal buffer.'''
-        try:
-            temp = self.__getTemperature()
-        except pyowm.commons.exceptions.PyOWMError:
-            print('Error with OpenWeatherMap, maybe bad API key ?')
-            temp = -1
+        '''Update the source. Renders the cached temperature and refreshes it in the background when outdated.'''
+        stale = self.stale
+        if stale and not self._pending:
+            if (
+                not self._failed
+                or self._last_attempt is None
+                or time.monotonic() - self._last_attempt >= self.retry
+            ):
+                self.refresh()
         
-        self._buffer = self.__construct_buffer(temp)
-
-    def __getTemperature(self):
-        '''Get current temperature information.'''
-        observation = self.owm.weather_at_place(self._location)
-        temp = observation.weather.temperature('celsius')['temp']
+        if self._compositor is None:
+            self._compositor = self.__construct_compositor(self.rainbow, self.on_color)
+            self._stale_compositor = self.__construct_compositor(False, self.stale_color)
+            self._state = None
         
-        return round(temp)
+        reading = self._reading
+        state = (self.__text(reading[0]) if reading is not None else None, stale)
+        if state != self._state:
+            self._state = state
+            self._buffer = self.__construct_buffer(*state)
+            self.dirty = True
 
-    def __constructIndexes(self, temp):
-        '''Get array of indexes which map which letters to light up.'''
-        digit1 = []
-        digit2 = []
-        degree = []
-        
-        if 0 <= temp < 10:
-            if temp == 1:
-                offset = 1
-                offsetdeg = 0
-            else:
-                offset = 2
-                offsetdeg = 1
-                
-            for r, c in self.numbers[temp]:
-                digit1.append(self.rc_map[r, c+offset])
-            
-            for r, c in self.degree:
-                degree.append(self.rc_map[r, c+offsetdeg])
+    def ready(self):
+        '''Ready once the temperature of the location is fetched, a stale reading is never switched to.'''
+        return not self.stale
+
+    def refresh(self):
+        '''Ask the background worker to fetch the temperature.'''
+        if self._worker is None:
+            self._worker = threading.Thread(target=self.__fetch_forever, daemon=True)
+            self._worker.start()
         
-        elif temp < 0: 
-            if temp <= -10: # should not happen
-                temp = -9
-            offset1 = -1
-            if -temp == 1:
-                offset2 = 1
-                offsetdeg = 0
-            else:
-                offset2 = 4
-                offsetdeg = 3
+        self._pending = True
+        self._refresh.set()
+
+    def __fetch_forever(self):
+        '''Fetch the temperature each time a refresh is requested.'''
+        while True:
+            self._refresh.wait()
+            self._refresh.clear()
             
-            for r, c in self.minus:
-                digit1.append(self.rc_map[r, c+offset1])
-                
-            for r, c in self.numbers[-temp]:
-                digit2.append(self.rc_map[r, c+offset2])
+            location = self._location
+            try:
+                if self.provider is None:
+                    self.provider = create_provider(self.config, self.section, self.cache)
+                temp = self.provider.temperature(location)
+                self._reading = (temp, location, time.time())
+                self._failed = False
+                self.cache.store_reading(location, temp, self._reading[2])
+            except WeatherError as e:
+                print('Error with weather provider, maybe bad API key or location ? {}'.format(e))
+                self._failed = True
+            except Exception as e:
+                print('Error while fetching temperature: {}'.format(e))
+                self._failed = True
             
-            for r, c in self.degree:
-                degree.append(self.rc_map[r, c+offsetdeg])
+            self._last_attempt = time.monotonic()
+            self._pending = self._refresh.is_set()
+
+    def __cached_reading(self, location):
+        '''Get the last known reading at location from the weather cache.'''
+        reading = self.cache.reading(location)
+        if reading is None:
+            return None
         
+        temp, timestamp = reading
+        return temp, location, timestamp
+
+    def __text(self, temp):
+        '''Get the text of a temperature, without unit when it does not fit the panel.'''
+        value = round(temp, self.decimals) + 0.0
+        text = '{:.{}f}'.format(value, self.decimals)
+        if self.atlas.measure(text + self.unit) <= self.width:
+            text += self.unit
+        return text
+
+    def __construct_compositor(self, rainbow, on_color):
+        '''Prepare the color layers used to build frames.'''
+        compositor = Compositor(self.number_of_pixels)
+        compositor.off_color = self.off_color
+        if rainbow:
+            compositor.paint(self.rainbow_colors[self.columns])
         else:
-            if temp >= 100: # should not happen
-                temp = 99
-            offset1 = -1
-            if temp % 10 == 1:
-                offset2 = 1
-                offsetdeg = 0
-            else:
-                offset2 = 4
-                offsetdeg = 3
-            
-            for r, c in self.numbers[temp // 10]:
-                digit1.append(self.rc_map[r, c+offset1])
-                
-            for r, c in self.numbers[temp % 10]:
-                digit2.append(self.rc_map[r, c+offset2])
-            
-            for r, c in self.degree:
-                degree.append(self.rc_map[r, c+offsetdeg])
+            compositor.paint(on_color)
         
-        return (
-            digit1
-            + digit2
-            + degree
-        )
+        return compositor
 
-    def __construct_buffer(self, temp):
-        '''Construct display buffer given the current time and weekday.'''
-        buffer = np.zeros((self.number_of_pixels, 3), dtype=np.uint8)
-        led_indexes = self.__constructIndexes(temp)
+    def __construct_buffer(self, text, stale):
+        '''Construct display buffer given the temperature text, drawn with the stale color when outdated.'''
+        grid = self._grid
+        grid[:] = False
+        if text is not None:
+            bitmap = self.atlas.render(text)
+            blit(grid, bitmap, (self.height - bitmap.shape[0]) // 2, (self.width - bitmap.shape[1]) // 2)
         
-        for index in range(self.number_of_pixels):
-            if index in led_indexes:
-                if self.rainbow:
-                    row = (self.number_of_pixels - 1 - index) // self.width
-                    if (row - self.height + 1) % 2 == 0:
-                        column = (self.number_of_pixels - 1 - index) % self.width
-                    else:
-                        column = index % self.width
-                    
-                    buffer[index] = self.rainbow_colors[column]
-                
-                else:
-                    buffer[index] = self.on_color
-                
-            else:
-                buffer[index] = self.off_color
+        compositor = self._stale_compositor if stale else self._compositor
         
-        return buffer
+        return compositor.compose(grid[self.geometry.rows, self.geometry.columns])
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+# Imports
+import math
+import unicodedata
+import numpy as np
+from plugins.abstract import AbstractPlugin, RAINBOW, getcolor, gradient, rgb2hex
+from glyphs import blit, load_atlas
+
+# Glyphs of the text
+FONT = 'fonts/text.txt'
+
+# Columns scrolled per second
+SPEED = 8.0
+
+
+class TickerPlugin(AbstractPlugin):
+    '''Scroll a text message across the panel.
+
+    The message is rendered once to a strip of colors as high as the panel,
+    with a blank panel width on both sides to scroll in and out. Every frame is
+    the window of the strip at the scroll position, gathered into the buffer
+    with preallocated indexes. A new message asks to be shown until it scrolled
+    through once.
+    '''
+    def __init__(self, width=12, height=12, config=None):
+        '''Init the class'''
+        super().__init__(width, height, config)
+        self.section = 'ticker'
+
+        self.fps = self.config.getint(self.section, 'fps', fallback=30)
+
+        self._on_color = getcolor(self.config.get(self.section, 'on_rgb', fallback='#FFF'))
+        self._off_color = getcolor(self.config.get(self.section, 'off_rgb', fallback='#000'))
+        self._rainbow = self.config.getboolean(self.section, 'rainbow', fallback=False)
+
+        # Columns scrolled per second
+        self.speed = self.config.getfloat(self.section, 'speed', fallback=SPEED)
+        if not math.isfinite(self.speed) or self.speed <= 0:
+            print('Invalid ticker speed {}, using {}'.format(self.speed, SPEED))
+            self.speed = SPEED
+
+        self.atlas = load_atlas(self.config.get(self.section, 'font', fallback=FONT))
+
+        # Strip of colors of the message, rebuilt whenever the message or a color changes
+        self._strip = None
+        self._period = self.width
+        self._base = None
+        self._indexes = np.zeros(self.number_of_pixels, dtype=np.intp)
+        self._buffer = np.zeros((self.number_of_pixels, 3), dtype=np.uint8)
+
+        # Scroll position, in columns of the strip
+        self._position = 0.0
+        self._column = None
+
+        # The text of the settings is shown on schedule, messages received over MQTT on request
+        self.text = self.config.get(self.section, 'text', fallback='', raw=True)
+        self._pending = False
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        self._text = self.normalize(text)
+        self._strip = None
+        self._position = 0.0
+        self._pending = bool(self._text)
+
+    @property
+    def on_color(self):
+        return self._on_color
+
+    @on_color.setter
+    def on_color(self, color):
+        self._on_color = color
+        self._strip = None
+
+    @property
+    def off_color(self):
+        return self._off_color
+
+    @off_color.setter
+    def off_color(self, color):
+        self._off_color = color
+        self._strip = None
+
+    @property
+    def rainbow(self):
+        return self._rainbow
+
+    @rainbow.setter
+    def rainbow(self, boolean):
+        self._rainbow = boolean
+        self._strip = None
+
+    @property
+    def topics(self):
+        return [
+            'wordclock/plugin/ticker/text',
+            'wordclock/plugin/ticker/on',
+            'wordclock/plugin/ticker/off',
+            'wordclock/plugin/ticker/rainbow',
+            'wordclock/plugin/ticker/speed',
+        ]
+
+    @property
+    def subscription_filter(self):
+        return 'wordclock/plugin/ticker/#'
+
+    def callback(self, client, userdata, msg):
+        print('%s %s' % (msg.topic, msg.payload))
+
+        if msg.topic == 'wordclock/plugin/ticker/text':
+            self.text = msg.payload.decode('utf-8')
+
+        elif msg.topic == 'wordclock/plugin/ticker/rainbow':
+            txt = msg.payload.decode('utf-8')
+            self.rainbow = txt.lower() == 'true'
+            self.config.set(self.section, 'rainbow', txt)
+
+        elif msg.topic == 'wordclock/plugin/ticker/speed':
+            try:
+                speed = float(msg.payload.decode('utf-8'))
+                if not math.isfinite(speed) or speed <= 0:
+                    raise ValueError(speed)
+                self.speed = speed
+                self.config.set(self.section, 'speed', str(self.speed))
+            except ValueError:
+                print('Invalid speed')
+
+        else:
+            try:
+                color = getcolor(msg.payload.decode('utf-8'))
+                if msg.topic == 'wordclock/plugin/ticker/on':
+                    self.on_color = color
+                    self.config.set(self.section, 'on_rgb', rgb2hex(self.on_color))
+                elif msg.topic == 'wordclock/plugin/ticker/off':
+                    self.off_color = color
+                    self.config.set(self.section, 'off_rgb', rgb2hex(self.off_color))
+            except ValueError:
+                print('Invalid RGB value')
+
+    def normalize(self, text):
+        '''Get text in capitals, without the accents the font has no glyph for.'''
+        chars = []
+        for char in text.upper():
+            if char not in self.atlas:
+                char = unicodedata.normalize('NFKD', char)[0]
+            chars.append(char)
+
+        return ''.join(chars)
+
+    def update(self, dt):
+        '''Update the source. Scrolls by the columns covered in dt milliseconds.'''
+        if self._strip is None:
+            self.__construct_strip()
+
+        self._position += self.speed * dt / 1000
+        if self._position >= self._period:
+            self._position %= self._period
+            self._pending = False
+
+        column = int(self._position)
+        if column != self._column:
+            self._column = column
+            np.add(self._base, column, out=self._indexes)
+            np.take(self._strip, self._indexes, axis=0, out=self._buffer)
+            self.dirty = True
+
+    def next_update(self):
+        '''Seconds until the window reaches the next column, at most fps times a second.'''
+        if self.speed <= 0:
+            return None
+        return max((int(self._position) + 1 - self._position) / self.speed, 1 / self.fps)
+
+    def prepare(self):
+        '''Start from the beginning, unless a new message is still scrolling through.'''
+        if not self._pending:
+            self._position = 0.0
+        self.update(0)
+
+    def requested(self):
+        '''Whether a new message has not scrolled through yet.'''
+        return self._pending
+
+    def __construct_strip(self):
+        '''Render the message to a strip of colors, and index the LEDs of its window at column 0.'''
+        bitmap = self.atlas.render(self._text)
+        length = bitmap.shape[1]
+
+        grid = np.zeros((self.height, length + 2 * self.width), dtype=bool)
+        blit(grid, bitmap, (self.height - self.atlas.height) // 2, self.width)
+
+        strip = np.empty(grid.shape + (3,), dtype=np.uint8)
+        strip[...] = self.off_color
+        if self.rainbow and length:
+            on = np.zeros_like(strip)
+            on[:, self.width:self.width + length] = gradient(RAINBOW, length)
+            np.copyto(strip, on, where=grid[..., None])
+        else:
+            np.copyto(strip, np.array(self.on_color, dtype=np.uint8), where=grid[..., None])
+
+        # The window scrolls from the blank before the message to the blank after it
+        self._strip = strip.reshape(-1, 3)
+        self._period = length + self.width
+        self._position %= self._period
+        self._base = self.geometry.rows * grid.shape[1] + self.geometry.columns
+        self._column = None
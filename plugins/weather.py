@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+# Imports
+import abc
+import json
+import os
+import time
+import threading
+
+
+class WeatherError(Exception):
+    '''Raised when a provider cannot give the temperature.'''
+
+
+class WeatherCache:
+    '''Last readings and geocoded locations, persisted in a small JSON file.'''
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = {'readings': {}, 'locations': {}}
+
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            self._data['readings'].update(data.get('readings', {}))
+            self._data['locations'].update(data.get('locations', {}))
+        except (OSError, ValueError):
+            pass
+
+    def reading(self, location):
+        '''Get the last (temperature, timestamp) at location, None if unknown.'''
+        reading = self._data['readings'].get(location)
+        if reading is None:
+            return None
+        return reading['temp'], reading['time']
+
+    def store_reading(self, location, temp, timestamp=None):
+        with self._lock:
+            self._data['readings'][location] = {
+                'temp': temp,
+                'time': time.time() if timestamp is None else timestamp,
+            }
+            self.__write()
+
+    def coordinates(self, location):
+        '''Get the (latitude, longitude) of location, None if unknown.'''
+        coordinates = self._data['locations'].get(location)
+        if coordinates is None:
+            return None
+        return tuple(coordinates)
+
+    def store_coordinates(self, location, lat, lon):
+        with self._lock:
+            self._data['locations'][location] = [lat, lon]
+            self.__write()
+
+    def __write(self):
+        '''Write the cache to a temporary file and move it over the previous one.'''
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print('Could not write weather cache: {}'.format(e))
+
+
+class WeatherProvider(abc.ABC):
+    def __init__(self, cache=None):
+        self.cache = cache
+
+    @abc.abstractmethod
+    def temperature(self, location):
+        '''Get the current temperature in celsius at location, raises WeatherError on failure.'''
+
+
+class OpenWeatherMapProvider(WeatherProvider):
+    '''Temperature from OpenWeatherMap, with geocoded locations kept in cache.'''
+    def __init__(self, api_key, cache=None, timeout=5, retries=2):
+        super().__init__(cache)
+        import pyowm
+        from pyowm.utils.config import get_default_config
+
+        self._errors = pyowm.commons.exceptions.PyOWMError
+
+        # Setting max_retries makes pyowm reuse one pooled requests session
+        config = get_default_config()
+        config['connection']['timeout_secs'] = timeout
+        config['connection']['max_retries'] = retries
+
+        owm = pyowm.OWM(api_key, config)
+        self.weather = owm.weather_manager()
+        self.geocoding = owm.geocoding_manager()
+
+    def temperature(self, location):
+        try:
+            lat, lon = self.__coordinates(location)
+            observation = self.weather.weather_at_coords(lat, lon)
+            return observation.weather.temperature('celsius')['temp']
+        except self._errors as e:
+            raise WeatherError(str(e)) from e
+
+    def __coordinates(self, location):
+        '''Geocode a "City, CC" location, from the cache when possible.'''
+        if self.cache is not None:
+            coordinates = self.cache.coordinates(location)
+            if coordinates is not None:
+                return coordinates
+
+        name, _, country = location.partition(',')
+        results = self.geocoding.geocode(name.strip(), country=country.strip() or None, limit=1)
+        if not results:
+            raise WeatherError('Unknown location {}'.format(location))
+
+        lat, lon = results[0].lat, results[0].lon
+        if self.cache is not None:
+            self.cache.store_coordinates(location, lat, lon)
+
+        return lat, lon
+
+
+class FileProvider(WeatherProvider):
+    '''Temperature read from a local JSON file or URL, for offline testing.
+
+    The JSON document is either a number, {"temp": value} or {location: value}.
+    '''
+    def __init__(self, source, cache=None, timeout=5):
+        super().__init__(cache)
+        self.source = source
+        self.timeout = timeout
+        self.session = None
+
+    def temperature(self, location):
+        import requests
+
+        try:
+            if self.source.startswith(('http://', 'https://')):
+                if self.session is None:
+                    self.session = requests.Session()
+                response = self.session.get(self.source, timeout=self.timeout)
+                response.raise_for_status()
+                data = response.json()
+            else:
+                with open(self.source, encoding='utf-8') as f:
+                    data = json.load(f)
+        except (OSError, ValueError, requests.RequestException) as e:
+            raise WeatherError(str(e)) from e
+
+        if isinstance(data, dict):
+            data = data.get('temp', data.get(location))
+
+        try:
+            return float(data)
+        except (TypeError, ValueError):
+            raise WeatherError('No temperature for {} in {}'.format(location, self.source))
+
+
+def create_cache(config, section):
+    '''Create the weather cache from a configuration section.'''
+    return WeatherCache(config.get(section, 'cache', fallback='cache/weather.json'))
+
+
+def create_provider(config, section, cache=None):
+    '''Create the weather provider, and its cache when not given, from a configuration section.'''
+    if cache is None:
+        cache = create_cache(config, section)
+    provider = config.get(section, 'provider', fallback='openweathermap')
+
+    if provider == 'openweathermap':
+        return OpenWeatherMapProvider(config.get(section, 'api_key'), cache)
+    if provider == 'file':
+        return FileProvider(config.get(section, 'source'), cache)
+
+    raise ValueError('Unknown weather provider {}'.format(provider))
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+# Seconds between two checks of a plugin which is due but not ready yet
+READY_POLL = 0.1
+
+
+class Scheduled:
+    '''A plugin and its scheduling policy.
+
+    A plugin without duration is a background plugin, shown whenever no other
+    plugin is due. Other plugins are shown for duration seconds, every repeat
+    seconds and whenever they request it.
+    '''
+    def __init__(self, plugin, priority=0, duration=None, repeat=None, weight=1.0):
+        self.plugin = plugin
+        self.priority = priority
+        self.duration = duration
+        self.repeat = repeat
+        self.weight = weight
+
+        self.started = None
+        self.ended = None
+        self.prepared = False
+        self.due_since = None
+
+    @property
+    def background(self):
+        return self.duration is None
+
+    def due_time(self):
+        '''Time of the next periodic showing, None if the plugin is only shown on request.'''
+        if self.repeat is None:
+            return None
+        return self.ended + self.repeat
+
+
+class Scheduler:
+    '''Pick the plugin shown by the display.
+
+    A due plugin preempts background plugins, and preempts another plugin only
+    with a higher priority; otherwise it waits for the current plugin to finish.
+    Due plugins of the same priority are shown by order of weighted waiting time.
+    Plugins are asked to prepare their first frame lead seconds before they are
+    due, and are only switched to once ready, or skipped after timeout seconds.
+    '''
+    def __init__(self, entries, lead=5.0, timeout=10.0, now=0.0):
+        if not any(entry.background for entry in entries):
+            raise ValueError('The scheduler needs a background plugin')
+
+        self.entries = entries
+        self.lead = lead
+        self.timeout = timeout
+        self.current = None
+
+        for entry in entries:
+            entry.ended = now
+
+    def __due(self, entry, t):
+        if entry.plugin.requested():
+            return True
+        due_time = entry.due_time()
+        return due_time is not None and t >= due_time
+
+    def __start(self, entry, t):
+        entry.started = t
+        entry.prepared = False
+        entry.due_since = None
+        self.current = entry
+
+    def __end(self, entry, t):
+        entry.ended = t
+        entry.prepared = False
+        entry.due_since = None
+        if self.current is entry:
+            self.current = None
+
+    def select(self, t):
+        '''Get the plugin to show at time t, and whether it differs from the previous one.'''
+        previous = self.current
+
+        # End the showing of the current plugin
+        current = self.current
+        if current is not None and not current.background and t - current.started >= current.duration:
+            self.__end(current, t)
+
+        # Prepare the plugins about to be due, and collect the ready ones
+        candidates = []
+        for entry in self.entries:
+            if entry.background or entry is self.current:
+                continue
+
+            due_time = entry.due_time()
+            requested = entry.plugin.requested()
+            if not entry.prepared and (requested or (due_time is not None and t >= due_time - self.lead)):
+                entry.prepared = True
+                entry.plugin.prepare()
+
+            if not self.__due(entry, t):
+                continue
+            if entry.due_since is None:
+                entry.due_since = t
+
+            if entry.plugin.ready():
+                candidates.append(entry)
+            elif t - entry.due_since >= self.timeout:
+                print('{} was not ready in time, skipped'.format(type(entry.plugin).__name__))
+                self.__end(entry, t)
+
+        # Switch to the most urgent candidate when it may interrupt the current plugin
+        if candidates:
+            best = max(candidates, key=lambda entry: (entry.priority, entry.weight * (t - entry.due_since)))
+            current = self.current
+            if current is None or current.background or best.priority > current.priority:
+                if current is not None and not current.background:
+                    self.__end(current, t)
+                self.__start(best, t)
+
+        # Fall back to a background plugin
+        if self.current is None:
+            background = [entry for entry in self.entries if entry.background]
+            self.__start(max(background, key=lambda entry: (entry.priority, entry.weight)), t)
+
+        return self.current.plugin, self.current is not previous
+
+    def next_update(self, t):
+        '''Seconds until the next scheduling event, None if there is none.'''
+        timeouts = []
+        current = self.current
+        if current is not None and not current.background:
+            timeouts.append(current.started + current.duration - t)
+
+        for entry in self.entries:
+            if entry.background or entry is current:
+                continue
+
+            if entry.due_since is not None:
+                timeouts.append(READY_POLL)
+                continue
+
+            due_time = entry.due_time()
+            if due_time is not None:
+                timeouts.append(due_time - t if entry.prepared else due_time - self.lead - t)
+
+        if not timeouts:
+            return None
+        return max(min(timeouts), 0)
+
+
+def create_scheduler(plugins, config, now=0.0):
+    '''Create the scheduler of plugins, with the policies of their configuration sections.'''
+    entries = []
+    for plugin in plugins:
+        section = plugin.section
+        duration = config.getfloat(section, 'duration', fallback=None)
+        entries.append(Scheduled(
+            plugin,
+            priority=config.getint(section, 'priority', fallback=0),
+            duration=duration,
+            repeat=config.getfloat(section, 'repeat', fallback=None) if duration is not None else None,
+            weight=config.getfloat(section, 'weight', fallback=1.0),
+        ))
+
+    return Scheduler(
+        entries,
+        lead=config.getfloat('scheduler', 'prepare', fallback=5.0),
+        timeout=config.getfloat('scheduler', 'prepare_timeout', fallback=10.0),
+        now=now,
+    )
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import os
+import stat
+import atexit
+import tempfile
+import threading
+import configparser
+
+# Seconds to wait for more changes before writing the settings file
+DEBOUNCE = 5.0
+
+# Serializes changes and writes of every Settings instance
+_lock = threading.RLock()
+
+# Permissions of a new settings file, temporary files are only readable by their owner
+_umask = os.umask(0)
+os.umask(_umask)
+
+
+class Settings(configparser.ConfigParser):
+    '''Settings shared by the display and plugins.
+
+    Changes made with set() are batched and written to path once no other change
+    happened for debounce seconds. Only the changed options are merged into the
+    file on disk, which is replaced atomically. With path None nothing is written.
+    '''
+    def __init__(self, path='settings.conf', debounce=DEBOUNCE):
+        self.path = path
+        self.debounce = debounce
+        self._lock = _lock
+        self._changes = {}
+        self._timer = None
+        super().__init__()
+
+        if path is not None:
+            self.read(path)
+            atexit.register(self.flush)
+
+    def set(self, section, option, value=None):
+        with self._lock:
+            super().set(section, option, value)
+            if self.path is not None:
+                self._changes[section, option] = value
+                self.__schedule()
+
+    def __schedule(self):
+        '''Restart the debounce timer.'''
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.debounce, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self):
+        '''Write the pending changes to the settings file now.'''
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._changes:
+                return
+            changes, self._changes = self._changes, {}
+
+            # Merge with the file on disk, it may have been edited since it was read
+            disk = configparser.ConfigParser()
+            disk.read(self.path)
+            for (section, option), value in changes.items():
+                if not disk.has_section(section):
+                    disk.add_section(section)
+                disk.set(section, option, value)
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            tmp = None
+            try:
+                fd, tmp = tempfile.mkstemp(prefix='.settings', dir=directory)
+                with os.fdopen(fd, 'w') as configfile:
+                    disk.write(configfile)
+                    configfile.flush()
+                    os.fsync(configfile.fileno())
+                self.__copy_permissions(tmp)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                print('Could not write settings: {}'.format(e))
+                # Keep the changes for the next write, behind any made since
+                changes.update(self._changes)
+                self._changes = changes
+                if tmp is not None:
+                    try:
+                        os.unlink(tmp)
+                    except OSError:
+                        pass
+
+    def __copy_permissions(self, tmp):
+        '''Give the temporary file the mode and owner of the settings file it replaces.'''
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            os.chmod(tmp, 0o666 & ~_umask)
+            return
+
+        os.chmod(tmp, stat.S_IMODE(st.st_mode))
+        try:
+            # The application may run as root, the file stays editable by its owner
+            os.chown(tmp, st.st_uid, st.st_gid)
+        except OSError:
+            pass
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+'''
+Week simulation.
+Renders the clock frame of every minute of the week for each layout into one
+preallocated array, and hashes the frames of every day into a manifest.
+Comparing with a manifest written before a change tells which layouts and
+days render differently.
+'''
+
+# Imports
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+from layout import parse_size
+from settings import Settings
+
+# Global variables
+GOLDEN = 'golden'
+
+# Bump when the manifest content changes
+VERSION = 1
+
+
+def load_config(layout):
+    '''Settings of a simulation: the example settings, so frames do not depend on the user settings.'''
+    config = Settings(None)
+    config.read('settings.conf.example')
+    config.set('clock', 'simulate', 'False')
+    config.set('display', 'layout', layout)
+
+    return config
+
+
+def digest(frames):
+    return hashlib.sha256(np.ascontiguousarray(frames).data).hexdigest()
+
+
+def simulate(layouts, width, height):
+    '''Render the week of every layout and get the manifest of their hashes.'''
+    from plugins.clock import ClockPlugin, MINUTES_PER_WEEK
+
+    frames = np.empty((MINUTES_PER_WEEK, width * height, 3), dtype=np.uint8)
+    days = frames.reshape(7, -1)
+
+    manifest = {
+        'version': VERSION,
+        'size': '{}x{}'.format(width, height),
+        'layouts': {},
+    }
+    for layout in layouts:
+        plugin = ClockPlugin(width, height, load_config(layout))
+        plugin.render_week(out=frames)
+        manifest['layouts'][os.path.basename(layout)] = {
+            'week': digest(frames),
+            'days': [digest(day) for day in days],
+        }
+
+    return manifest
+
+
+def compare(manifest, golden):
+    '''Get the differences between a manifest and the golden manifest, as text lines.'''
+    if golden.get('version') != manifest['version'] or golden.get('size') != manifest['size']:
+        return ['golden manifest is version {} for {}, expected version {} for {}'.format(
+            golden.get('version'), golden.get('size'), manifest['version'], manifest['size'])]
+
+    differences = []
+    expected = golden.get('layouts', {})
+    for name, hashes in manifest['layouts'].items():
+        if name not in expected:
+            differences.append('{}: missing from the golden manifest'.format(name))
+        elif hashes['week'] != expected[name]['week']:
+            changed = [
+                str(weekday) for weekday, (day, golden_day) in enumerate(zip(hashes['days'], expected[name]['days']))
+                if day != golden_day
+            ]
+            differences.append('{}: frames changed on weekdays {}'.format(name, ', '.join(changed)))
+
+    return differences
+
+
+# Main body
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser(description='Render every minute of the week of the layouts and hash the frames.')
+    parser.add_argument('layouts', nargs='*', help='layout JSON files (default: all)')
+    parser.add_argument('--size', default='12x12', help='panel size (default: %(default)s)')
+    parser.add_argument('--golden', metavar='FILE', help='golden manifest (default: {}/week-<size>.json)'.format(GOLDEN))
+    parser.add_argument('--update', action='store_true', help='write the golden manifest instead of comparing with it')
+    args = parser.parse_args()
+
+    width, height = parse_size(args.size)
+    layouts = args.layouts or sorted(glob.glob('layouts/*.json'))
+    golden_path = args.golden or os.path.join(GOLDEN, 'week-{}x{}.json'.format(width, height))
+
+    start = time.perf_counter()
+    manifest = simulate(layouts, width, height)
+    print('Rendered {} weeks of {}x{} frames in {:.2f} s'.format(len(layouts), width, height, time.perf_counter() - start))
+
+    if args.update:
+        os.makedirs(os.path.dirname(golden_path) or '.', exist_ok=True)
+        with open(golden_path, 'w') as f:
+            json.dump(manifest, f, indent=4)
+            f.write('\n')
+        print('Wrote {}'.format(golden_path))
+        sys.exit(0)
+
+    try:
+        with open(golden_path) as f:
+            golden = json.load(f)
+    except (OSError, ValueError) as e:
+        print('Cannot read golden manifest: {}'.format(e))
+        sys.exit(2)
+
+    differences = compare(manifest, golden)
+    for difference in differences:
+        print(difference)
+    if not differences:
+        print('{} layouts match {}'.format(len(layouts), golden_path))
+    sys.exit(1 if differences else 0)
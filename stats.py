@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+
+# Durations are counted in buckets of powers of two microseconds, up to ~8 s
+BUCKETS = 24
+
+
+class Histogram:
+    '''Cheap duration histogram with log2 buckets.'''
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, ns):
+        us = ns // 1000
+        self.counts[min(us.bit_length(), BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += us
+        if us > self.max:
+            self.max = us
+
+    def percentile(self, q):
+        '''Upper bound, in microseconds, of the bucket holding the q-th percentile.'''
+        if self.count == 0:
+            return 0
+        rank = q / 100 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(1 << bucket, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean_us': self.total // self.count if self.count else 0,
+            'p50_us': self.percentile(50),
+            'p90_us': self.percentile(90),
+            'p99_us': self.percentile(99),
+            'max_us': self.max,
+            'buckets': list(self.counts),
+        }
+
+
+class StartupTimer:
+    '''Time spent in each step of the start up, from started, a perf_counter() value.'''
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.steps = []
+        self._last = self.started
+
+    def mark(self, step):
+        '''Record the time spent since the previous mark in step.'''
+        now = time.perf_counter()
+        self.steps.append((step, now - self._last))
+        self._last = now
+
+    def total(self):
+        return self._last - self.started
+
+    def snapshot(self):
+        return {
+            'total_ms': round(self.total() * 1000, 1),
+            'steps_ms': {step: round(seconds * 1000, 1) for step, seconds in self.steps},
+        }
+
+    def report(self):
+        '''Print where the start up time went.'''
+        print('Startup in {:.0f} ms'.format(self.total() * 1000))
+        for step, seconds in self.steps:
+            print('  {:<16} {:>8.1f} ms'.format(step, seconds * 1000))
+
+
+class FrameStats:
+    '''Per-stage timings and frame counters of the main loop.'''
+    def __init__(self, path=None, interval=60, late_threshold=0.05):
+        self.path = path
+        self.interval = interval
+        self.late_threshold = late_threshold
+
+        self.stages = {}
+        self.frames = 0
+        self.shown = 0
+        self.late = 0
+        self.dropped = 0
+
+        # StartupTimer of the process, reported with the frame statistics when set
+        self.startup = None
+
+        self._started = time.monotonic()
+        self._reported = self._started
+        self._mark = None
+
+    def begin(self):
+        '''Start timing a frame.'''
+        self._mark = time.perf_counter_ns()
+
+    def mark(self, stage):
+        '''Record the time spent since the previous mark in stage.'''
+        now = time.perf_counter_ns()
+        self.add(stage, now - self._mark)
+        self._mark = now
+
+    def add(self, stage, ns):
+        '''Record a duration of stage, timed by the caller.'''
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram()
+        histogram.add(ns)
+
+    def end(self, shown):
+        '''Count a finished frame.'''
+        self.frames += 1
+        if shown:
+            self.shown += 1
+
+    def woke(self, lateness):
+        '''Count the frame as late when the loop woke up lateness seconds after its deadline.'''
+        if lateness > self.late_threshold:
+            self.late += 1
+
+    def snapshot(self):
+        snapshot = {
+            'uptime': round(time.monotonic() - self._started, 3),
+            'frames': self.frames,
+            'shown': self.shown,
+            'late': self.late,
+            'dropped': self.dropped,
+            'stages': {stage: histogram.snapshot() for stage, histogram in list(self.stages.items())},
+        }
+        if self.startup is not None:
+            snapshot['startup'] = self.startup.snapshot()
+
+        return snapshot
+
+    def report_time(self):
+        '''Monotonic time the next report is due.'''
+        return self._reported + self.interval
+
+    def next_report(self):
+        '''Seconds until the next report is due.'''
+        return self.report_time() - time.monotonic()
+
+    def report(self, client=None, force=False):
+        '''Publish the statistics on wordclock/stats/# and write them to the stats file, when due.'''
+        if not force and self.next_report() > 0:
+            return
+        self._reported = time.monotonic()
+
+        snapshot = self.snapshot()
+        if client is not None:
+            for key in ('uptime', 'frames', 'shown', 'late', 'dropped'):
+                client.publish('wordclock/stats/' + key, snapshot[key])
+            if 'startup' in snapshot:
+                client.publish('wordclock/stats/startup_ms', snapshot['startup']['total_ms'])
+            for stage, histogram in snapshot['stages'].items():
+                for key, value in histogram.items():
+                    if key != 'buckets':
+                        client.publish('wordclock/stats/{}/{}'.format(stage, key), value)
+
+        if self.path is not None:
+            tmp = self.path + '.tmp'
+            try:
+                with open(tmp, 'w') as f:
+                    json.dump(snapshot, f)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                print('Could not write stats: {}'.format(e))
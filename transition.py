@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import time
+import numpy as np
+from geometry import get_geometry
+
+EFFECTS = ('cut', 'crossfade', 'wipe', 'slide')
+
+# Width, in columns, of the soft edge of the wipe
+WIPE_EDGE = 2.0
+
+
+class Transition:
+    '''Blend the outgoing and incoming frames of a source switch.
+
+    Every scratch buffer is allocated once and frames are rendered with in-place
+    NumPy operations, so a running transition creates no garbage.
+    '''
+    def __init__(self, width, height, effect='crossfade', duration=1.0, fps=30):
+        if effect not in EFFECTS:
+            raise ValueError('Invalid transition effect {}'.format(effect))
+
+        self.width = width
+        self.height = height
+        self.number_of_pixels = width * height
+        self.effect = effect
+        self.duration = duration
+        self.fps = fps
+        self.active = False
+        self._start = 0
+
+        shape = (self.number_of_pixels, 3)
+        self.buffer = np.zeros(shape, dtype=np.uint8)
+
+        # Outgoing and incoming frames, stacked for the slide gathers
+        self._pair = np.zeros((2 * self.number_of_pixels, 3), dtype=np.uint8)
+        self._outgoing = self._pair[:self.number_of_pixels]
+        self._incoming = self._pair[self.number_of_pixels:]
+
+        # Crossfade in 8 bits fixed point
+        self._mix = np.zeros(shape, dtype=np.uint16)
+        self._scaled = np.zeros(shape, dtype=np.uint16)
+
+        # Wipe with per LED float weights
+        geometry = get_geometry(width, height)
+        self._columns = geometry.columns.astype(np.float32)
+        self._weights = np.zeros((self.number_of_pixels, 1), dtype=np.float32)
+        self._base = np.zeros(shape, dtype=np.float32)
+        self._difference = np.zeros(shape, dtype=np.float32)
+        self._blend = np.zeros(shape, dtype=np.float32)
+
+        # Slide: for every shift, the index in _pair shown by each LED
+        rows, columns = geometry.rows, geometry.columns
+        self._slides = np.empty((width + 1, self.number_of_pixels), dtype=np.intp)
+        for shift in range(width + 1):
+            source = columns + shift
+            incoming = source >= width
+            self._slides[shift] = np.where(
+                incoming,
+                self.number_of_pixels + geometry.index_map[rows, np.where(incoming, source - width, 0)],
+                geometry.index_map[rows, np.where(incoming, 0, source)],
+            )
+
+    def start(self, outgoing, incoming, now=None):
+        '''Start blending from the outgoing frame to the incoming frame, at now (a monotonic time) or immediately.'''
+        if self.effect == 'cut' or self.duration <= 0:
+            return
+
+        np.copyto(self._outgoing, outgoing)
+        np.copyto(self._base, outgoing)
+        self.retarget(incoming)
+        self._start = time.monotonic() if now is None else now
+        self.active = True
+
+    def retarget(self, incoming):
+        '''Replace the incoming frame, when the incoming source changes during the transition.'''
+        np.copyto(self._incoming, incoming)
+        np.subtract(self._incoming, self._base, out=self._difference)
+
+    def render(self, now=None):
+        '''Render the step of the transition at now (a monotonic time) or of the current time, in buffer.'''
+        if now is None:
+            now = time.monotonic()
+        progress = (now - self._start) / self.duration
+        if progress >= 1:
+            self.active = False
+            np.copyto(self.buffer, self._incoming)
+            return self.buffer
+
+        if self.effect == 'crossfade':
+            weight = int(progress * 256)
+            np.multiply(self._outgoing, np.uint16(256 - weight), out=self._mix)
+            np.multiply(self._incoming, np.uint16(weight), out=self._scaled)
+            np.add(self._mix, self._scaled, out=self._mix)
+            np.right_shift(self._mix, 8, out=self._mix)
+            np.copyto(self.buffer, self._mix, casting='unsafe')
+
+        elif self.effect == 'wipe':
+            np.subtract(progress * (self.width + WIPE_EDGE), self._columns[:, None], out=self._weights)
+            np.divide(self._weights, WIPE_EDGE, out=self._weights)
+            np.clip(self._weights, 0, 1, out=self._weights)
+            np.multiply(self._difference, self._weights, out=self._blend)
+            np.add(self._blend, self._base, out=self._blend)
+            np.copyto(self.buffer, self._blend, casting='unsafe')
+
+        elif self.effect == 'slide':
+            shift = int(progress * self.width)
+            np.take(self._pair, self._slides[shift], axis=0, out=self.buffer)
+
+        return self.buffer
+
+    def next_update(self):
+        '''Seconds until the next step, None when no transition is running.'''
+        if self.active:
+            return 1 / self.fps
+        return None